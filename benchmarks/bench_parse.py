@@ -0,0 +1,72 @@
+import argparse
+import csv
+import datetime
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from synthetic import write_synthetic_csv
+
+# Compare the original parser (DictReader + strptime + a DEBUG log line per row)
+# with events.read_events, the columnar events.read_csv_columns and the dashboard's
+# pandas path events.read_events_df.
+# Usage: python benchmarks/bench_parse.py [--sizes 10000 100000 1000000]
+
+# The parser as it was before the fast path, kept here as the baseline
+def legacy_read_csv(file_path):
+    events = []
+    with open(file_path, mode='r', encoding='UTF-8') as file:
+        reader = csv.DictReader(file)
+        i = 1
+        for row in reader:
+            logging.debug(f"Reading row {i}")
+            event_name = row['Event name'].strip()
+            event_date = datetime.datetime.strptime(row['Event date and time'].strip(), '%m/%d/%Y %H:%M:%S')
+            event_weekday = row['Weekday'].strip()
+            events.append({'name': event_name, 'date': event_date, 'weekday': event_weekday})
+            i += 1
+    return events
+
+def time_call(function, *args):
+    start_time = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start_time
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reminders.csv parsers")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_parse_')
+    # Log at DEBUG to a file like reminders.py does, to measure the real logging cost
+    logging.basicConfig(filename=os.path.join(work_dir, 'reminders.log'), level=logging.DEBUG,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    import events
+
+    parsers = [
+        ('legacy', legacy_read_csv),
+        ('read_events', events.read_events),
+        ('read_csv_columns', events.read_csv_columns),
+    ]
+    try:
+        import pandas
+        parsers.append(('read_events_df', events.read_events_df))
+    except ImportError:
+        pass
+    try:
+        print(f"{'rows':>10}  " + "  ".join(f"{name:>16}" for name, _ in parsers) + "  speedup")
+        for size in args.sizes:
+            file_path = write_synthetic_csv(os.path.join(work_dir, f"reminders_{size}.csv"), size)
+            timings = [time_call(function, file_path) for _, function in parsers]
+            print(f"{size:>10}  " + "  ".join(f"{timing:>15.3f}s" for timing in timings) + f"  {timings[0] / timings[1]:>6.1f}x")
+    finally:
+        logging.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import datetime
+import http.server
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from synthetic import DISTRIBUTIONS, write_synthetic_csv
+
+# End-to-end benchmark of the reminder pipeline on synthetic data:
+#   read_events     parsing reminders.csv
+#   check_events    a whole reminders.py run, delivering to a local stub webhook
+#   dashboard_prep  the dashboard's data preparation (events and metrics DataFrames)
+# Each scenario reports latency percentiles over --repeat runs, throughput in rows per
+# second at the median and the tracemalloc peak of one extra (untimed) run. Results are
+# saved in benchmarks/results/<commit>.json; --compare <commit> prints the change against
+# an earlier result and exits with status 1 when a median got slower than --threshold.
+# Usage: python benchmarks/bench_pipeline.py [--sizes 1000 10000 100000] [--compare HEAD~1]
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# Local HTTP server standing in for the Make webhook; accepts every POST
+class StubWebhook:
+    def __init__(self):
+        stub = self
+        self.received = 0
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                stub.received += 1
+                self.send_response(200)
+                self.send_header('Content-Length', '8')
+                self.end_headers()
+                self.wfile.write(b'Accepted')
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/webhook"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+# Write a metrics.jsonl with one reminders.py run per hour up to now
+def write_synthetic_metrics(file_path, runs):
+    now = datetime.datetime.now()
+    with open(file_path, 'w', encoding='UTF-8') as file:
+        for i in range(runs):
+            record = {
+                'timestamp': (now - datetime.timedelta(hours=runs - i)).isoformat(),
+                'reminders_tomorrow_count': i % 7,
+                'reminders_3days_count': i % 11,
+                'total_reminders_count': 1000,
+                'execution_time': 0.05 + (i % 13) / 100,
+                'memory_delta': 0.1,
+            }
+            file.write(json.dumps(record) + '\n')
+    return file_path
+
+# What dashboard.py does on a cache miss: the first page of upcoming reminders with its
+# is_tomorrow column and the metrics of the default 30-day range
+def prepare_dashboard(csv_path, metrics_path, page_size=50):
+    import pandas as pd
+    from events import EventIndex, read_events_df
+    from metrics_store import load_metrics
+    events_df = read_events_df(csv_path)
+    event_index = EventIndex(range(len(events_df)), dates=events_df['date'].tolist())
+    today = datetime.date.today()
+    page_rows = event_index.events_between(today, datetime.date.max)[:page_size]
+    tomorrow_date = today + datetime.timedelta(days=1)
+    tomorrow_rows = set(event_index.events_between(tomorrow_date, tomorrow_date))
+    page_df = events_df.iloc[page_rows].copy()
+    page_df['is_tomorrow'] = [row in tomorrow_rows for row in page_rows]
+    range_end = datetime.datetime.now()
+    metrics_df = pd.DataFrame(load_metrics(metrics_path, range_end - datetime.timedelta(days=30), range_end))
+    if not metrics_df.empty:
+        metrics_df['timestamp'] = pd.to_datetime(metrics_df['timestamp'])
+        metrics_df['date'] = metrics_df['timestamp'].dt.date
+    return page_df, metrics_df
+
+# Time `repeat` runs after one warm-up, then trace one more run for the memory peak
+def measure(function, repeat):
+    function()
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start_time)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return timings, peak
+
+def summarize(timings, peak, rows):
+    from metrics_rollup import percentile
+    median = statistics.median(timings)
+    return {
+        'rows': rows,
+        'runs': len(timings),
+        'p50': median,
+        'p95': percentile(timings, 0.95),
+        'max': max(timings),
+        'mean': statistics.mean(timings),
+        'rows_per_second': rows / median if median else None,
+        'peak_kb': peak / 1024,
+    }
+
+def git_revision():
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return f"{revision}-dirty" if dirty else revision
+
+# Results file of a revision or an explicit path
+def results_path_for(revision):
+    if os.path.exists(revision):
+        return revision
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', revision], cwd=ROOT,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    return os.path.join(RESULTS_DIR, f"{revision}.json")
+
+def save_results(report):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    file_path = os.path.join(RESULTS_DIR, f"{report['revision']}.json")
+    with open(file_path, 'w', encoding='UTF-8') as file:
+        json.dump(report, file, indent=2)
+    return file_path
+
+# Print the change of every scenario against a baseline report; returns the regressions
+def compare(report, baseline, threshold):
+    regressions = []
+    print(f"\nAgainst {baseline['revision']} ({baseline['timestamp']}):")
+    for key, result in report['results'].items():
+        previous = baseline['results'].get(key)
+        if previous is None:
+            print(f"  {key:<28} (new)")
+            continue
+        change = result['p50'] / previous['p50'] - 1
+        memory_change = result['peak_kb'] / previous['peak_kb'] - 1 if previous['peak_kb'] else 0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        print(f"  {key:<28} p50 {previous['p50'] * 1000:9.2f} -> {result['p50'] * 1000:9.2f} ms ({change:+.1%})"
+              f"   peak {memory_change:+.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the reminder pipeline on synthetic data")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--distribution', choices=DISTRIBUTIONS, default='uniform')
+    parser.add_argument('--with-cache', action='store_true', help="write the event cache like the downloader does")
+    parser.add_argument('--metrics-runs', type=int, default=5_000, help="records in the synthetic metrics file")
+    parser.add_argument('--compare', help="git revision (or results file) to compare with")
+    parser.add_argument('--threshold', type=float, default=0.10, help="median slowdown counted as a regression")
+    parser.add_argument('--no-save', action='store_true', help="do not write benchmarks/results/<commit>.json")
+    args = parser.parse_args()
+
+    revision = git_revision()
+    work_dir = tempfile.mkdtemp(prefix='bench_pipeline_')
+    previous_dir = os.getcwd()
+    # reminders.py writes its log, metrics and outbox to the working directory
+    os.chdir(work_dir)
+    stub = StubWebhook()
+    try:
+        import events
+        import reminders
+        reminders.webhook_url = stub.url
+        reminders.SCHEDULE_PATH = os.path.join(ROOT, 'schedule.json')
+        metrics_path = write_synthetic_metrics(os.path.join(work_dir, 'dashboard_metrics.jsonl'), args.metrics_runs)
+
+        report = {
+            'revision': revision,
+            'timestamp': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'settings': {'repeat': args.repeat, 'distribution': args.distribution, 'with_cache': args.with_cache},
+            'results': {},
+        }
+        print(f"{'scenario':<28} {'p50 ms':>10} {'p95 ms':>10} {'max ms':>10} {'rows/s':>12} {'peak KB':>10}")
+        for size in args.sizes:
+            csv_path = write_synthetic_csv(os.path.join(work_dir, 'reminders.csv'), size,
+                                           distribution=args.distribution)
+            if args.with_cache:
+                from event_cache import write_cache
+                write_cache(csv_path, events.read_csv_columns(csv_path))
+            else:
+                from event_cache import cache_path_for
+                if os.path.exists(cache_path_for(csv_path)):
+                    os.remove(cache_path_for(csv_path))
+
+            # Each timed run starts with cold date-parsing caches, like a cron run
+            def run_read_events():
+                events.parse_event_day.cache_clear()
+                events.read_events(csv_path)
+
+            def run_check_events():
+                events.parse_event_day.cache_clear()
+                reminders.check_events(csv_path)
+
+            scenarios = {
+                'read_events': run_read_events,
+                'check_events': run_check_events,
+                'dashboard_prep': lambda: prepare_dashboard(csv_path, metrics_path),
+            }
+            for name, function in scenarios.items():
+                key = f"{name}@{size}"
+                timings, peak = measure(function, args.repeat)
+                result = summarize(timings, peak, size)
+                report['results'][key] = result
+                print(f"{key:<28} {result['p50'] * 1000:10.2f} {result['p95'] * 1000:10.2f} "
+                      f"{result['max'] * 1000:10.2f} {result['rows_per_second']:12.0f} {result['peak_kb']:10.0f}")
+        print(f"(webhook stub received {stub.received} payloads)")
+    finally:
+        stub.close()
+        logging.shutdown()
+        os.chdir(previous_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if not args.no_save:
+        print(f"Saved {save_results(report)}")
+    if args.compare:
+        baseline_path = results_path_for(args.compare)
+        if not os.path.exists(baseline_path):
+            print(f"No results for {args.compare} ({baseline_path}), run the benchmark on that commit first")
+            sys.exit(2)
+        with open(baseline_path, 'r', encoding='UTF-8') as file:
+            baseline = json.load(file)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} scenario(s) slower than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
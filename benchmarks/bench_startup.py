@@ -0,0 +1,93 @@
+import argparse
+import io
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Measure the import cost every cron run of the entry points pays, using -X importtime.
+# The scripts are loaded with runpy under a name other than __main__, so only their
+# module-level code (imports, logging and dotenv setup) runs, and then the modules a
+# normal run imports later on are imported too, so lazily imported modules still count.
+# Usage: python benchmarks/bench_startup.py [--repeat 5] [--against <git revision>]
+
+ENTRY_POINTS = {
+    # Webhook delivery and metrics
+    'reminders.py': ['requests', 'psutil'],
+    # A run with a valid token: no refresh and no OAuth flow
+    'sheet-downloader.py': ['googleapiclient.discovery', 'psutil'],
+}
+# Imported by the interpreter itself before the script starts
+STARTUP_MODULES = {'site', 'encodings', 'runpy'}
+
+# Run one entry point's module level under -X importtime from a scratch directory.
+# Returns (total import time in ms, {top-level module: cumulative ms}).
+def measure(source_dir, script, run_imports):
+    work_dir = tempfile.mkdtemp(prefix='bench_startup_')
+    try:
+        code = (
+            f"import sys, runpy; sys.path.insert(0, {source_dir!r}); "
+            f"runpy.run_path({os.path.join(source_dir, script)!r}, run_name='bench_startup'); "
+            + "".join(f"import {module}; " for module in run_imports)
+        )
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                cwd=work_dir, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"{script} failed to load:\n{result.stderr[-2000:]}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented under the module that triggered them
+        if not name.startswith('  ') and name.strip() not in STARTUP_MODULES:
+            modules[name.strip()] = int(cumulative) / 1000
+    return sum(modules.values()), modules
+
+# Median total and per-module times over `repeat` runs
+def measure_median(source_dir, script, repeat):
+    runs = [measure(source_dir, script, ENTRY_POINTS[script]) for _ in range(repeat)]
+    total = statistics.median(total for total, _ in runs)
+    modules = {name: statistics.median(run[1].get(name, 0) for run in runs) for name in runs[0][1]}
+    return total, modules
+
+# Extract a git revision of the tree into a temp directory
+def export_revision(revision):
+    archive = subprocess.run(['git', 'archive', revision], cwd=ROOT, capture_output=True, check=True).stdout
+    target = tempfile.mkdtemp(prefix='bench_startup_rev_')
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target)
+    return target
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark entry point import time")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--against', help="git revision to compare with, e.g. HEAD~1")
+    parser.add_argument('--top', type=int, default=5, help="heaviest top-level imports to list")
+    args = parser.parse_args()
+
+    baseline_dir = export_revision(args.against) if args.against else None
+    try:
+        for script in ENTRY_POINTS:
+            total, modules = measure_median(ROOT, script, args.repeat)
+            line = f"{script:<22} {total:8.1f} ms"
+            if baseline_dir and os.path.exists(os.path.join(baseline_dir, script)):
+                baseline_total, _ = measure_median(baseline_dir, script, args.repeat)
+                line += f"   {args.against}: {baseline_total:8.1f} ms   ({baseline_total - total:.1f} ms saved)"
+            print(line)
+            for name, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:args.top]:
+                print(f"    {name:<40} {cumulative:8.1f} ms")
+    finally:
+        if baseline_dir:
+            shutil.rmtree(baseline_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
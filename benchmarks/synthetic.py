@@ -0,0 +1,36 @@
+import csv
+import datetime
+import random
+
+WEEKDAYS = ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']
+EVENT_NAMES = ['數學小考', '英文單字', '物理作業', '化學實驗報告', '國文默寫', '地科報告', '生物小考', '繳交表單']
+
+DISTRIBUTIONS = ['uniform', 'clustered']
+
+# Write a reminders.csv in the downloader's format with `rows` events spread over
+# `days_before` days in the past to `days_after` days in the future of `around`.
+# distribution 'uniform' spreads them evenly, 'clustered' piles them up around `around`
+# (a triangular distribution peaking there), so the reminder windows hold many events.
+def write_synthetic_csv(file_path, rows, around=None, days_before=365, days_after=60, seed=0,
+                        distribution='uniform'):
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution {distribution!r}, expected one of {DISTRIBUTIONS}")
+    rng = random.Random(seed)
+    around = around or datetime.datetime.now()
+    span = (days_before + days_after) * 24 * 60
+    start = around - datetime.timedelta(days=days_before)
+    with open(file_path, mode='w', encoding='UTF-8', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['Event name', 'Event date and time', 'Weekday'])
+        for i in range(rows):
+            if distribution == 'uniform':
+                minutes = rng.randrange(span)
+            else:
+                minutes = int(rng.triangular(0, span, days_before * 24 * 60))
+            event_date = start + datetime.timedelta(minutes=minutes)
+            writer.writerow([
+                f"{rng.choice(EVENT_NAMES)} {i}",
+                event_date.strftime('%m/%d/%Y %H:%M:%S'),
+                WEEKDAYS[event_date.weekday()],
+            ])
+    return file_path
@@ -1,63 +1,268 @@
 import streamlit as st
-import json
 import os
 import pandas as pd
 import altair as alt
 import datetime
-import csv
 import psutil
+from events import EventIndex, read_events_df
+from log_reader import LEVELS, read_page
+from metrics_rollup import load_rollups, rollup_path_for
+from metrics_store import load_metrics
+from system_sampler import SystemSampler
 
-# Function to load metrics from metrics.json
-def load_metrics(file_path):
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='UTF-8') as file:
-            return json.load(file)
-    return []
-
-# Function to load logs from a log file (if any)
-def load_logs(file_path):
-    if os.path.exists(file_path):
-        with open(file_path, 'r', encoding='UTF-8') as file:
-            return file.read()
-    return "No logs available."
-
-# Function to read reminders from reminders.csv
-def read_csv(file_path):
-    events = []
-    with open(file_path, mode='r', encoding='UTF-8') as file:
-        reader = csv.DictReader(file)
-        for row in reader:
-            event_name = row['Event name'].strip()
-            event_date = datetime.datetime.strptime(row['Event date and time'].strip(), '%m/%d/%Y %H:%M:%S')
-            event_weekday = row['Weekday'].strip()
-            events.append({'name': event_name, 'date': event_date, 'weekday': event_weekday})
-    return events
-
-# Function to get system usage metrics
-def get_system_usage():
-    cpu_usage = psutil.cpu_percent(interval=1)
-    cpu_count = psutil.cpu_count()
-    cpu_freq_curr, cpu_freq_min, cpu_freq_max = psutil.cpu_freq()
-    memory_info = psutil.virtual_memory()
-    memory_swap = psutil.swap_memory()
-    disk_usage = psutil.disk_usage('/')
-    net_info  = psutil.net_if_stats()
-    network_info = psutil.net_io_counters()
-    network_sent = network_info.bytes_sent
-    network_recv = network_info.bytes_recv
-    uptime = datetime.datetime.now() - datetime.datetime.fromtimestamp(psutil.boot_time())
-    return cpu_usage, cpu_count, cpu_freq_curr, cpu_freq_min, cpu_freq_max, memory_info, memory_swap, disk_usage, net_info, network_sent, network_recv, uptime
-
-
-# Load metrics and logs
-metrics_file_path = 'metrics.json'
-downloader_metrics_file_path = 'downloader_metrics.json'
-logs_file_path = 'reminders.log'
+# Function to get a file's modification time and size, used as a cache key so
+# cached data is reloaded only when the file actually changes
+def file_signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+# Function to get the cache key of a metrics file together with its rollups
+def metrics_signature(file_path):
+    return file_signature(file_path), file_signature(rollup_path_for(file_path))
+
+# Function to pick the chart resolution for a time range: raw runs for about a month,
+# daily rollups up to half a year and weekly rollups beyond that
+def pick_resolution(start, end):
+    days = (end - start).days + 1
+    if days <= 31:
+        return "raw"
+    if days <= 180:
+        return "daily"
+    return "weekly"
+
+# Function to load a metrics time window into a DataFrame (cached per file version, window
+# and resolution), from the raw records or the pre-aggregated rollups
+@st.cache_data(max_entries=16, show_spinner=False)
+def load_metrics_df(file_path, signature, start, end, resolution):
+    if resolution == "raw":
+        metrics_df = pd.DataFrame(load_metrics(file_path, start, end))
+    else:
+        metrics_df = pd.DataFrame(load_rollups(file_path, resolution, start, end))
+    if not metrics_df.empty:
+        metrics_df['timestamp'] = pd.to_datetime(metrics_df['timestamp'])
+        metrics_df['date'] = metrics_df['timestamp'].dt.date
+    return metrics_df
+
+# Function to load reminders.csv into a DataFrame (cached per file version). Kept as a shared
+# resource so reruns do not copy the whole table; callers only ever take slices of it.
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_events_df(file_path, signature):
+    return read_events_df(file_path)
+
+# Function to build the date index over the reminders table's rows once per file version;
+# its "events" are row positions (kept as a resource, not copied on every rerun)
+@st.cache_resource(max_entries=2, show_spinner=False)
+def load_event_index(file_path, signature):
+    events_df = load_events_df(file_path, signature)
+    return EventIndex(range(len(events_df)), dates=events_df['date'].tolist())
+
+# Function to filter the reminders table on the server: the rows dated in [start_date, end_date]
+# from the date index, then a case-insensitive search on the event name (cached per file
+# version and filters). Returns row positions in CSV order.
+@st.cache_data(max_entries=16, show_spinner=False)
+def filter_event_rows(file_path, signature, start_date, end_date, query):
+    rows = load_event_index(file_path, signature).events_between(start_date, end_date)
+    if query:
+        names = load_events_df(file_path, signature)['name'].iloc[rows]
+        matches = names.str.contains(query, case=False, regex=False)
+        rows = [row for row, match in zip(rows, matches) if match]
+    return rows
+
+# Function to display the reminders table one page at a time, so only the visible page
+# is serialized to the browser
+def show_events(file_path, key):
+    signature = file_signature(file_path)
+    events_df = load_events_df(file_path, signature)
+    if events_df.empty:
+        st.write("No reminders available.")
+        return
+
+    show_col, search_col, count_col = st.columns([1,1,1])
+    with show_col:
+        show = st.selectbox("Show", ["Upcoming", "Date range", "All"], key=f"{key}_show")
+    with search_col:
+        query = st.text_input("Search event name", key=f"{key}_query").strip()
+    with count_col:
+        count = st.selectbox("Rows per page", [25, 50, 100, 200], index=1, key=f"{key}_count")
+    today = datetime.date.today()
+    if show == "Upcoming":
+        start_date, end_date = today, datetime.date.max
+    elif show == "Date range":
+        picked = st.date_input("Event dates", value=(today, today + datetime.timedelta(days=30)), key=f"{key}_range")
+        # Only the start is set while the end date is being picked
+        start_date, end_date = (picked[0], picked[-1]) if picked else (today, today)
+    else:
+        start_date, end_date = datetime.date.min, datetime.date.max
+    rows = filter_event_rows(file_path, signature, start_date, end_date, query)
+
+    # Current page; back to the first one when the filters or the file change
+    filters = (show, start_date, end_date, query, count, signature)
+    if st.session_state.get(f"{key}_filters") != filters:
+        st.session_state[f"{key}_filters"] = filters
+        st.session_state[f"{key}_page"] = 0
+    pages = max(1, -(-len(rows) // count))
+    page = min(st.session_state[f"{key}_page"], pages - 1)
+    page_rows = rows[page * count:(page + 1) * count]
+
+    # Tomorrow's reminders come from one index lookup, then only the page's rows are marked
+    tomorrow_date = today + datetime.timedelta(days=1)
+    tomorrow_rows = set(load_event_index(file_path, signature).events_between(tomorrow_date, tomorrow_date))
+    page_df = events_df.iloc[page_rows].copy()
+    page_df['is_tomorrow'] = [row in tomorrow_rows for row in page_rows]
+
+    st.dataframe(
+        data=page_df,
+        use_container_width=True,
+        height=min(900, 38 + 35 * max(len(page_df), 1)),
+        hide_index=True,
+        column_config={
+            "name": st.column_config.TextColumn(label="Event name"),
+            "date": st.column_config.DatetimeColumn(
+                label="Event date and time",
+                format="YYYY/MM/DD HH:mm:ss"),
+            "weekday": st.column_config.TextColumn(label="Weekday"),
+            "is_tomorrow": st.column_config.CheckboxColumn(label="Tomorrow's Reminder")})
+
+    previous, position, following = st.columns([1,1,1])
+    with previous:
+        if st.button("Previous", key=f"{key}_previous", disabled=page == 0, use_container_width=True):
+            st.session_state[f"{key}_page"] = page - 1
+            st.rerun()
+    with position:
+        if rows:
+            st.caption(f"Rows {page * count + 1}-{page * count + len(page_rows)} of {len(rows)} (page {page + 1} of {pages})")
+        else:
+            st.caption("No reminders match the filters.")
+    with following:
+        if st.button("Next", key=f"{key}_next", disabled=page >= pages - 1, use_container_width=True):
+            st.session_state[f"{key}_page"] = page + 1
+            st.rerun()
+
+# Function to read one page of a log file from the end (cached per file version and page)
+@st.cache_data(max_entries=32, show_spinner=False)
+def read_log_page(file_path, signature, count, end_offset, min_level, start, end):
+    return read_page(file_path, count, end_offset, min_level, start, end)
+
+# Function to display a log file one page at a time, newest page first
+def show_log(label, file_path, key):
+    level_col, count_col, range_col = st.columns([1,1,1])
+    with level_col:
+        min_level = st.selectbox("Minimum level", LEVELS, index=1, key=f"{key}_level")
+    with count_col:
+        count = st.number_input("Lines per page", min_value=50, max_value=5000, value=200, step=50, key=f"{key}_count")
+    with range_col:
+        use_range = st.checkbox("Only the selected metrics range", key=f"{key}_range")
+    start, end = (range_start, range_end) if use_range else (None, None)
+
+    # Stack of page end offsets, None being the end of the file; reset when the filters change
+    filters = (min_level, count, use_range, start, end)
+    if st.session_state.get(f"{key}_filters") != filters:
+        st.session_state[f"{key}_filters"] = filters
+        st.session_state[f"{key}_offsets"] = [None]
+    offsets = st.session_state[f"{key}_offsets"]
+
+    lines, previous_offset = read_log_page(file_path, file_signature(file_path), count, offsets[-1], min_level, start, end)
+    older, newer, latest = st.columns([1,1,1])
+    with older:
+        if st.button("Older", key=f"{key}_older", disabled=previous_offset == 0, use_container_width=True):
+            offsets.append(previous_offset)
+            st.rerun()
+    with newer:
+        if st.button("Newer", key=f"{key}_newer", disabled=len(offsets) == 1, use_container_width=True):
+            offsets.pop()
+            st.rerun()
+    with latest:
+        if st.button("Latest", key=f"{key}_latest", disabled=len(offsets) == 1, use_container_width=True):
+            offsets[:] = [None]
+            st.rerun()
+    st.text_area(label, value="\n".join(lines) if lines else "No logs available.", height=450, label_visibility="collapsed")
+
+# Function to chart the per-stage durations (stage_<name>_time fields) of each run as stacked
+# bars, with the tracemalloc peaks of the latest traced run underneath when there are any
+def show_stage_breakdown(label, metrics_df):
+    stage_columns = [column for column in metrics_df.columns
+                     if column.startswith('stage_') and column.endswith('_time')]
+    if not stage_columns:
+        st.write(f"No stage timings recorded for {label.lower()} yet.")
+        return
+    stages_df = metrics_df[['timestamp', *stage_columns]].melt(
+        id_vars='timestamp', var_name='stage', value_name='seconds').dropna()
+    stages_df['stage'] = stages_df['stage'].str[len('stage_'):-len('_time')]
+    stages_chart = alt.Chart(stages_df).mark_bar().encode(
+        x=alt.X('timestamp:T', title=None),
+        y=alt.Y('sum(seconds):Q', title='seconds'),
+        color='stage:N',
+        tooltip=['timestamp:T', 'stage:N', alt.Tooltip('seconds:Q', format='.4f')]
+    ).properties(
+        title=label,
+        height=250
+    ).interactive(bind_x=True, bind_y=False)
+    st.altair_chart(stages_chart, use_container_width=True)
 
-metrics = load_metrics(metrics_file_path)
-downloader_metrics = load_metrics(downloader_metrics_file_path)
-logs = load_logs(logs_file_path)
-downloader_logs = load_logs('downloader.log')
+    peak_columns = [column for column in metrics_df.columns
+                    if column.startswith('stage_') and column.endswith('_peak_kb')]
+    if not peak_columns:
+        return
+    traced_df = metrics_df.dropna(subset=peak_columns, how='all')
+    if not traced_df.empty:
+        latest = traced_df.iloc[-1]
+        st.caption(f"Peak memory per stage (tracemalloc) at {latest['timestamp']:%Y-%m-%d %H:%M}: " + ", ".join(
+            f"{column[len('stage_'):-len('_peak_kb')]} {latest[column]:.1f} KB"
+            for column in peak_columns if pd.notna(latest[column])))
+
+# Function to keep the runs that completed (older records carry no status), dropping
+# those without `column` such as rollup buckets holding only skipped or aborted runs
+def completed_runs(metrics_df, column):
+    if 'status' in metrics_df:
+        metrics_df = metrics_df[metrics_df['status'].isna() | (metrics_df['status'] == 'ok')]
+    if column in metrics_df:
+        metrics_df = metrics_df.dropna(subset=[column])
+    return metrics_df
+
+# Function to show the runs in the range that did not complete: skipped because another
+# run held the lock, failed (a Sheets API error, or one profile of a --profiles run), or
+# timed out / aborted by the supervisor
+def show_run_status(label, metrics_df):
+    failed_df = None
+    if 'status' in metrics_df:
+        failed_df = metrics_df[metrics_df['status'].notna() & (metrics_df['status'] != 'ok')]
+        counts = failed_df['status'].value_counts().to_dict()
+    else:
+        # Rollups count the runs per status
+        counts = {column[len('status_'):-len('_runs')]: int(metrics_df[column].sum())
+                  for column in metrics_df.columns
+                  if column.startswith('status_') and column.endswith('_runs') and column != 'status_ok_runs'}
+        counts = {status: runs for status, runs in counts.items() if runs}
+    if not counts:
+        st.caption(f"{label}: every run in the range completed.")
+        return
+    st.warning(f"{label}: " + ", ".join(f"{runs} {status.replace('_', ' ')}" for status, runs in counts.items()))
+    if failed_df is not None:
+        columns = [column for column in ['timestamp', 'profile', 'status', 'abort_stage', 'abort_reason'] if column in failed_df]
+        st.dataframe(failed_df[columns].tail(10).iloc[::-1], use_container_width=True, hide_index=True)
+
+# Function to start the background system sampler once per server process
+@st.cache_resource
+def get_sampler():
+    sampler = SystemSampler(interval=2.0, history=300)
+    sampler.start()
+    return sampler
+
+# Function to get system usage metrics from the sampler's latest snapshot
+def get_system_usage(sample):
+    cpu_freq_curr, cpu_freq_min, cpu_freq_max = sample['cpu_freq']
+    uptime = sample['timestamp'] - datetime.datetime.fromtimestamp(psutil.boot_time())
+    return (sample['cpu_usage'], sample['cpu_count'], cpu_freq_curr, cpu_freq_min, cpu_freq_max,
+            sample['memory_info'], sample['memory_swap'], sample['disk_usage'], sample['net_info'],
+            sample['network_sent'], sample['network_recv'], uptime)
+
+
+metrics_file_path = 'metrics.jsonl'
+downloader_metrics_file_path = 'downloader_metrics.jsonl'
+logs_file_path = 'reminders.log'
 
 # Streamlit dashboard
 st.set_page_config(page_title="Scripts Dashboard", layout="wide")
@@ -66,9 +271,24 @@ tab1, tab2, tab3 = st.tabs(["Dashboard", "System Info / Metrics", "Logs"])
 
 # Sidebar
 with sidebar:
+        # Only the selected window of metrics is loaded and charted
+        st.subheader("Metrics Range")
+        today = datetime.date.today()
+        date_range = st.date_input("Metrics range", value=(today - datetime.timedelta(days=30), today),
+                                   max_value=today, label_visibility="collapsed")
+        if len(date_range) == 2:
+            range_start, range_end = date_range
+        else:
+            # Only the first date has been picked so far
+            range_start = range_end = date_range[0]
+        range_start = datetime.datetime.combine(range_start, datetime.time.min)
+        range_end = datetime.datetime.combine(range_end, datetime.time.max)
+
     # Display System Usage
         st.subheader("Server Metrics")
-        cpu_usage, cpu_count, cpu_freq_curr, cpu_freq_min, cpu_freq_max, memory_info, memory_swap, disk_usage, net_info, network_sent, network_recv, uptime = get_system_usage()
+        sampler = get_sampler()
+        sample = sampler.latest()
+        cpu_usage, cpu_count, cpu_freq_curr, cpu_freq_min, cpu_freq_max, memory_info, memory_swap, disk_usage, net_info, network_sent, network_recv, uptime = get_system_usage(sample)
         st.metric(label="CPU Usage", value=f"{cpu_usage} %")
         st.progress(int(cpu_usage))
         st.metric(label="Memory Usage", value=f"{memory_info.percent} %")
@@ -80,6 +300,17 @@ with sidebar:
         st.metric(label="Network Received", value=f"{network_recv / (1024 ** 2):.2f} MB")
         st.metric(label="System Uptime", value=str(uptime).split('.')[0])
 
+        # Short CPU / memory history from the sampler's ring buffer
+        history_df = pd.DataFrame(
+            [(s['timestamp'], s['cpu_usage'], s['memory_info'].percent) for s in sampler.history()],
+            columns=['timestamp', 'CPU %', 'Memory %'])
+        st.line_chart(history_df, x='timestamp', y=['CPU %', 'Memory %'], height=200)
+
+# Load metrics (re-parsed only when the files change)
+resolution = pick_resolution(range_start, range_end)
+metrics_df = load_metrics_df(metrics_file_path, metrics_signature(metrics_file_path), range_start, range_end, resolution)
+dl_metrics_df = load_metrics_df(downloader_metrics_file_path, metrics_signature(downloader_metrics_file_path), range_start, range_end, resolution)
+
 # Dashboard
 with tab1:
     column1, column2 = st.columns([1,1], gap="medium")
@@ -87,44 +318,31 @@ with tab1:
     # Display Reminders
     with column1:
         st.subheader("Reminders")
-        events = read_csv("reminders.csv")
-        if events:
-            events_df = pd.DataFrame(events)
-            
-            # Calculate tomorrow's date
-            tomorrow = datetime.datetime.now() + datetime.timedelta(days=1)
-            tomorrow_date = tomorrow.date()
-            
-            # Add a new column to indicate if the reminder is for tomorrow
-            events_df['is_tomorrow'] = events_df['date'].dt.date == tomorrow_date
-            
-            st.dataframe(
-                data=events_df,
-                use_container_width=True,
-                height=900,
-                column_config={
-                    "name": st.column_config.TextColumn(label="Event name"),
-                    "date": st.column_config.DatetimeColumn(
-                        label="Event date and time",
-                        format="YYYY/MM/DD HH:mm:ss"),
-                    "weekday": st.column_config.TextColumn(label="Weekday"),
-                    "is_tomorrow": st.column_config.CheckboxColumn(label="Tomorrow's Reminder")})
-        else:
-            st.write("No reminders available.")
+        show_events("reminders.csv", "events")
 
     with column2:
         # Display Metrics
         st.header("Metrics")
-        if metrics:
-            metrics_df = pd.DataFrame(metrics)
-            dl_metrics_df = pd.DataFrame(downloader_metrics)
-
-            # Convert timestamp to datetime and extract date
-            metrics_df['timestamp'] = pd.to_datetime(metrics_df['timestamp'])
-            metrics_df['date'] = metrics_df['timestamp'].dt.date
-            dl_metrics_df['timestamp'] = pd.to_datetime(dl_metrics_df['timestamp'])
-            dl_metrics_df['date'] = dl_metrics_df['timestamp'].dt.date
+        if resolution != "raw":
+            st.caption(f"Showing {resolution} aggregates for the selected range (time charts show the mean).")
+        # Runs started with --profiles carry a profile name, chart one profile at a time
+        if 'profile' in metrics_df:
+            profile_names = sorted(metrics_df['profile'].dropna().unique())
+            if metrics_df['profile'].isna().any():
+                profile_names.insert(0, "(default)")
+            selected_profile = st.selectbox("Profile", profile_names)
+            if selected_profile == "(default)":
+                metrics_df = metrics_df[metrics_df['profile'].isna()]
+            else:
+                metrics_df = metrics_df[metrics_df['profile'] == selected_profile]
 
+        # Skipped, timed out and aborted runs are listed here and left out of the charts
+        st.subheader("Run Status")
+        show_run_status("Reminders", metrics_df)
+        show_run_status("Downloader", dl_metrics_df)
+        metrics_df = completed_runs(metrics_df, 'reminders_tomorrow_count')
+        dl_metrics_df = completed_runs(dl_metrics_df, 'request_time')
+        if not metrics_df.empty:
             graph1, graph2, graph3 = st.columns([1,1,1])
 
             # Plot the metrics
@@ -221,6 +439,13 @@ with tab1:
             else:
                 st.write("No download metrics available.")
 
+        # Where each run's time went
+        st.subheader("Run Stages")
+        if not metrics_df.empty:
+            show_stage_breakdown("Reminders", metrics_df)
+        if not dl_metrics_df.empty:
+            show_stage_breakdown("Downloader", dl_metrics_df)
+
 # System Info / Metrics
 with tab2:
     st.header("System Info / Metrics")  
@@ -282,10 +507,7 @@ with tab2:
         st.write(f"System Uptime: {uptime}")
 
         st.subheader("System Processes")
-        processes = []
-        for process in psutil.process_iter(['pid', 'name', 'username']):
-            processes.append(process.info)
-        processes_df = pd.DataFrame(processes)
+        processes_df = pd.DataFrame(sample['processes'])
         st.dataframe(
             data=processes_df,
             use_container_width=True,
@@ -296,6 +518,6 @@ with tab3:
     # Display Logs
     st.header("Logs")
     st.subheader("Reminders Log")
-    st.text_area("Reminders Logs", value=logs, height=450, label_visibility="collapsed")
+    show_log("Reminders Logs", logs_file_path, "reminders_log")
     st.subheader("Downloader Log")
-    st.text_area("Downloader Logs", value=downloader_logs, height=450, label_visibility="collapsed")
\ No newline at end of file
+    show_log("Downloader Logs", 'downloader.log', "downloader_log")
\ No newline at end of file
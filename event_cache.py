@@ -0,0 +1,150 @@
+import array
+import datetime
+import hashlib
+import mmap
+import os
+import shutil
+import struct
+import sys
+import tempfile
+
+# Pre-parsed event cache written by the downloader next to reminders.csv, so the
+# consumers can skip CSV and date parsing. File layout (little-endian):
+#   header     magic, version, flags, event count, source CSV size, source CSV mtime_ns,
+#              string table length, sha256 of the source CSV
+#   timestamps int64 per event, seconds since 1970-01-01 of the (naive, local) event time
+#   offsets    uint32 per string + 1, character offsets into the string table;
+#              strings are stored as name, weekday, name, weekday, ...
+#   strings    the UTF-8 encoded string table
+
+CACHE_MAGIC = b'RMEC'
+CACHE_VERSION = 1
+HEADER = struct.Struct('<4sHHIQqQ32s4x')
+TIMESTAMP = struct.Struct('<q')
+OFFSET = struct.Struct('<I')
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Cache file that belongs to a CSV file (reminders.csv -> reminders.cache)
+def cache_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + '.cache'
+
+# sha256 of a file, read in blocks
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()
+
+# Writes a cache one event at a time: the three sections are spooled to temporary files
+# and joined behind the header in finish(), so memory stays flat whatever the event count.
+# Call finish() once csv_path holds the CSV the events came from, or discard() to drop them.
+class CacheWriter:
+    def __init__(self, csv_path, cache_path=None):
+        self.csv_path = csv_path
+        self.cache_path = cache_path or cache_path_for(csv_path)
+        self.count = 0
+        self.length = 0
+        self._timestamps = tempfile.TemporaryFile()
+        self._offsets = tempfile.TemporaryFile()
+        self._strings = tempfile.TemporaryFile()
+        self._offsets.write(OFFSET.pack(0))
+
+    def add(self, name, date, weekday):
+        self._timestamps.write(TIMESTAMP.pack(int((date - EPOCH).total_seconds())))
+        for text in (name, weekday):
+            self.length += len(text)
+            self._offsets.write(OFFSET.pack(self.length))
+            self._strings.write(text.encode('UTF-8'))
+        self.count += 1
+
+    def finish(self):
+        # Stat before hashing so a CSV rewritten meanwhile makes this cache look stale
+        stat = os.stat(self.csv_path)
+        header = HEADER.pack(CACHE_MAGIC, CACHE_VERSION, 0, self.count, stat.st_size, stat.st_mtime_ns,
+                             self._strings.tell(), file_hash(self.csv_path))
+        temp_path = f"{self.cache_path}.tmp"
+        try:
+            with open(temp_path, 'wb') as file:
+                file.write(header)
+                for section in (self._timestamps, self._offsets, self._strings):
+                    section.seek(0)
+                    shutil.copyfileobj(section, file)
+            os.replace(temp_path, self.cache_path)
+        finally:
+            self.discard()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return self.cache_path
+
+    def discard(self):
+        for section in (self._timestamps, self._offsets, self._strings):
+            section.close()
+
+# Write the cache for csv_path from already parsed columns ({'name', 'date', 'weekday'} lists)
+def write_cache(csv_path, columns, cache_path=None):
+    writer = CacheWriter(csv_path, cache_path)
+    for name, date, weekday in zip(columns['name'], columns['date'], columns['weekday']):
+        writer.add(name, date, weekday)
+    return writer.finish()
+
+# Header fields of a cache file as a dict, or None if it is missing or not a cache
+def read_cache_header(cache_path):
+    try:
+        with open(cache_path, 'rb') as file:
+            data = file.read(HEADER.size)
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    magic, version, flags, count, source_size, source_mtime_ns, strings_size, source_hash = HEADER.unpack(data)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    return {
+        'count': count,
+        'source_size': source_size,
+        'source_mtime_ns': source_mtime_ns,
+        'strings_size': strings_size,
+        'source_hash': source_hash.hex(),
+    }
+
+# True when the cache was written from the CSV exactly as it is on disk now
+def is_cache_fresh(csv_path, cache_path=None):
+    header = read_cache_header(cache_path or cache_path_for(csv_path))
+    if header is None:
+        return False
+    try:
+        stat = os.stat(csv_path)
+    except OSError:
+        return False
+    return header['source_size'] == stat.st_size and header['source_mtime_ns'] == stat.st_mtime_ns
+
+# Load the cache through mmap: the timestamp array is copied out in one block and the
+# string table is decoded once, then sliced by offset.
+# Returns {'timestamp': array('q'), 'name': [...], 'weekday': [...]}
+def load_cache(cache_path):
+    with open(cache_path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        magic, version, flags, count, source_size, source_mtime_ns, strings_size, source_hash = HEADER.unpack_from(data)
+        if magic != CACHE_MAGIC or version != CACHE_VERSION:
+            raise ValueError(f"{cache_path} is not a version {CACHE_VERSION} event cache")
+        position = HEADER.size
+        timestamps = array.array('q')
+        timestamps.frombytes(data[position:position + 8 * count])
+        position += 8 * count
+        offsets = array.array('I')
+        offsets.frombytes(data[position:position + 4 * (2 * count + 1)])
+        position += 4 * (2 * count + 1)
+        string_table = data[position:position + strings_size].decode('UTF-8')
+    if sys.byteorder == 'big':
+        timestamps.byteswap()
+        offsets.byteswap()
+    if len(timestamps) != count or len(string_table) != offsets[-1]:
+        raise ValueError(f"{cache_path} is truncated")
+
+    names = [string_table[offsets[i]:offsets[i + 1]] for i in range(0, 2 * count, 2)]
+    weekdays = [string_table[offsets[i]:offsets[i + 1]] for i in range(1, 2 * count, 2)]
+    return {'timestamp': timestamps, 'name': names, 'weekday': weekdays}
+
+# Convert cached timestamps back to the naive datetimes the CSV parser produces
+def timestamps_to_datetimes(timestamps):
+    return [EPOCH + datetime.timedelta(seconds=timestamp) for timestamp in timestamps]
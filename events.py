@@ -0,0 +1,145 @@
+import bisect
+import collections
+import csv
+import datetime
+import functools
+import logging
+import time
+from event_cache import cache_path_for, is_cache_fresh, load_cache, timestamps_to_datetimes
+
+# Event model and loading shared by reminders.py, the downloader's cache writer and the dashboard
+
+# One reminder row; a namedtuple keeps events small (no per-instance __dict__)
+Event = collections.namedtuple('Event', ['name', 'date', 'weekday'])
+
+DATE_FORMAT = '%m/%d/%Y %H:%M:%S'
+
+# Year, month and day of a "MM/DD/YYYY" string; cached because many events share a date
+@functools.lru_cache(maxsize=4096)
+def parse_event_day(text):
+    month, day, year = text.split('/')
+    return int(year), int(month), int(day)
+
+# Parse an "MM/DD/YYYY HH:MM:SS" timestamp without strptime, falling back to
+# strptime (and its error message) for anything that does not split cleanly
+def parse_event_datetime(text):
+    try:
+        date_part, time_part = text.split(' ')
+        hour, minute, second = time_part.split(':')
+        return datetime.datetime(*parse_event_day(date_part), int(hour), int(minute), int(second))
+    except ValueError:
+        return datetime.datetime.strptime(text, DATE_FORMAT)
+
+# Read the CSV into columns (names, dates, weekdays) instead of one dict per row
+def read_csv_columns(file_path):
+    names = []
+    dates = []
+    weekdays = []
+    with open(file_path, mode='r', encoding='UTF-8', newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return {'name': names, 'date': dates, 'weekday': weekdays}
+        name_column = header.index('Event name')
+        date_column = header.index('Event date and time')
+        weekday_column = header.index('Weekday')
+        for row in reader:
+            if not row:
+                continue
+            names.append(row[name_column].strip())
+            dates.append(parse_event_datetime(row[date_column].strip()))
+            weekdays.append(row[weekday_column].strip())
+    return {'name': names, 'date': dates, 'weekday': weekdays}
+
+
+# Load event columns from the downloader's binary cache when it matches the current
+# CSV, otherwise parse the CSV
+def load_event_columns(file_path):
+    cache_path = cache_path_for(file_path)
+    if is_cache_fresh(file_path, cache_path):
+        try:
+            cache = load_cache(cache_path)
+            return {'name': cache['name'], 'date': timestamps_to_datetimes(cache['timestamp']), 'weekday': cache['weekday']}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable event cache {cache_path}: {e}")
+    return read_csv_columns(file_path)
+
+# Load events from reminders.csv (or its cache) as a list of Event tuples
+def read_events(file_path):
+    start_time = time.time()
+    logging.info(f"Reading events from CSV file: {file_path}")
+    columns = load_event_columns(file_path)
+    events = list(map(Event, columns['name'], columns['date'], columns['weekday']))
+    end_time = time.time()
+    logging.info(f"Read {len(events)} events from CSV file in {end_time - start_time:.4f} seconds.")
+    return events
+
+# Load events straight into a DataFrame with name, date and weekday columns, without
+# building Event tuples or dicts first. pandas is only imported by callers of this function.
+def read_events_df(file_path):
+    import numpy as np
+    import pandas as pd
+    cache_path = cache_path_for(file_path)
+    if is_cache_fresh(file_path, cache_path):
+        try:
+            cache = load_cache(cache_path)
+            return pd.DataFrame({
+                'name': cache['name'],
+                'date': pd.to_datetime(np.frombuffer(cache['timestamp'], dtype=np.int64), unit='s'),
+                'weekday': cache['weekday']})
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable event cache {cache_path}: {e}")
+
+    # Parse all dates in one vectorized pass with the explicit format
+    events_df = pd.read_csv(file_path, dtype=str, keep_default_na=False, encoding='UTF-8')
+    events_df = events_df.rename(columns={
+        'Event name': 'name',
+        'Event date and time': 'date',
+        'Weekday': 'weekday'})[['name', 'date', 'weekday']]
+    for column in ['name', 'date', 'weekday']:
+        events_df[column] = events_df[column].str.strip()
+    events_df['date'] = pd.to_datetime(events_df['date'], format=DATE_FORMAT)
+    return events_df
+
+# Date-ordered index over loaded events, so any horizon is a bisect lookup: O(log N + k)
+# for a window of k events instead of a pass over all of them. `events` can be any
+# sequence (e.g. the row positions of a DataFrame) when `dates` gives each item's datetime.
+class EventIndex:
+    def __init__(self, events, dates=None):
+        dates = [event.date for event in events] if dates is None else dates
+        self.events = events
+        self.order = sorted(range(len(dates)), key=dates.__getitem__)
+        self.datetimes = [dates[i] for i in self.order]
+        self.days = [date.date() for date in self.datetimes]
+
+    def __len__(self):
+        return len(self.order)
+
+    # Positions in date order of the events whose day falls in [start_date, end_date]
+    def _window(self, start_date, end_date):
+        lo = bisect.bisect_left(self.days, start_date)
+        hi = bisect.bisect_right(self.days, end_date)
+        return self.order[lo:hi]
+
+    # Events whose date falls in [start_date, end_date], in CSV order
+    def events_between(self, start_date, end_date):
+        return [self.events[i] for i in sorted(self._window(start_date, end_date))]
+
+    # The first k events at or after the datetime `after`, in date order
+    def next_n(self, k, after):
+        lo = bisect.bisect_left(self.datetimes, after)
+        return [self.events[i] for i in self.order[lo:lo + k]]
+
+    # [(day, events of that day in date order)] for the days in [start_date, end_date] that have events
+    def group_by_day(self, start_date, end_date):
+        return group_by_day([self.events[i] for i in self._window(start_date, end_date)])
+
+# Group date-ordered events into [(day, events)]
+def group_by_day(events):
+    groups = []
+    for event in events:
+        day = event.date.date()
+        if not groups or groups[-1][0] != day:
+            groups.append((day, []))
+        groups[-1][1].append(event)
+    return groups
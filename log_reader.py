@@ -0,0 +1,61 @@
+import datetime
+import mmap
+import os
+
+# Reads pages of the scripts' log files from the end without loading the whole file.
+# Lines look like "2025-01-17 20:00:01,234 - INFO - message" (see logging.basicConfig).
+
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+
+# Parse the timestamp and level at the start of a log line, or (None, None) for
+# lines that are not log records (e.g. traceback continuation lines)
+def parse_line(line):
+    parts = line.split(" - ", 2)
+    if len(parts) < 3:
+        return None, None
+    try:
+        timestamp = datetime.datetime.strptime(parts[0][:19], "%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        return None, None
+    return timestamp, parts[1]
+
+# Return up to `count` lines ending before byte offset `end_offset` (default: end of
+# file), newest last, plus the offset to pass back in to read the previous page.
+# min_level keeps records at that level or above; start/end keep records in a time range.
+# Lines that are not records (tracebacks from logging.exception, mostly) belong to the
+# record before them and are kept or dropped with it; when filtering, a page never splits
+# a record from those lines, so it can run over `count` by the length of a traceback.
+# The returned offset is 0 once the start of the file (or of the time range) is reached.
+def read_page(file_path, count=200, end_offset=None, min_level=None, start=None, end=None):
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return [], 0
+    allowed_levels = set(LEVELS[LEVELS.index(min_level):]) if min_level else None
+    filtering = allowed_levels is not None or start is not None or end is not None
+
+    lines = []
+    # Continuation lines read since the last record, newest first
+    continuation = []
+    with open(file_path, "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        position = len(data) if end_offset is None else min(end_offset, len(data))
+        # Ignore a trailing newline so the last line is not read as empty
+        if position and data[position - 1:position] == b"\n":
+            position -= 1
+        while position > 0 and len(lines) < count:
+            line_start = data.rfind(b"\n", 0, position) + 1
+            line = data[line_start:position].decode("UTF-8", errors="replace").rstrip("\r")
+            position = max(line_start - 1, 0)
+            if filtering:
+                timestamp, level = parse_line(line)
+                if timestamp is None:
+                    continuation.append(line)
+                    continue
+                lines_below, continuation = continuation, []
+                if start is not None and timestamp < start:
+                    # Log files are chronological, nothing older can match
+                    return lines[::-1], 0
+                if (end is not None and timestamp > end) or (allowed_levels is not None and level not in allowed_levels):
+                    continue
+                lines.extend(lines_below)
+            lines.append(line)
+        # Offset of the line start so the previous page ends right before it
+        return lines[::-1], (position + 1 if position > 0 else 0)
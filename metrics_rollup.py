@@ -0,0 +1,258 @@
+import datetime
+import json
+import math
+import os
+from metrics_store import load_metrics
+
+# Daily and weekly aggregates of a metrics file, updated as each record is appended, so
+# long time ranges can be charted without loading every raw record. Per bucket (and profile):
+#   *_count fields           last value (by timestamp, kept in counts_at, so records or
+#                             buckets arriving out of order never overwrite a newer one)
+#   *_time / *_latency fields count, sum, min, max and a log-scale histogram, giving the
+#                             mean (charted), min, max and an estimated p95
+#   status                    number of runs per status, as status_<status>_runs
+# Every bucket has a fixed-size state whatever the number of runs in it.
+#
+# Two files sit next to the metrics file:
+#   <name>.rollup.json    the open bucket of each resolution and profile, rewritten per record
+#   <name>.rollup.jsonl   closed buckets, one JSON line each, appended when a bucket closes
+# so a record costs the same however long the history is. The .json file is written last
+# and remembers the size of the .jsonl it goes with: lines past that size come from a run
+# that stopped before committing them, and are ignored and then overwritten.
+
+RESOLUTIONS = ["daily", "weekly"]
+ROLLUP_VERSION = 3
+# Histogram bins grow by 10%, so the p95 estimate is within about 5% of the true value
+BIN_GROWTH = 1.1
+# Values below this (including 0) share the lowest bin
+BIN_FLOOR = 1e-6
+
+# File rewritten on every update (its signature changes whenever the rollups do)
+def rollup_path_for(file_path):
+    return os.path.splitext(file_path)[0] + ".rollup.json"
+
+def closed_path_for(file_path):
+    return os.path.splitext(file_path)[0] + ".rollup.jsonl"
+
+def is_count_field(name):
+    return name.endswith("_count")
+
+def is_time_field(name):
+    return name.endswith("_time") or name.endswith("_latency")
+
+# Start date of the bucket a timestamp falls into
+def bucket_start(timestamp, resolution):
+    day = timestamp.date()
+    if resolution == "weekly":
+        day -= datetime.timedelta(days=day.weekday())
+    return day.isoformat()
+
+def bucket_key(bucket):
+    return f"{bucket['profile'] or ''}|{bucket['start']}"
+
+def new_bucket(start, profile):
+    return {"start": start, "profile": profile or None, "runs": 0, "counts": {}, "counts_at": None,
+            "times": {}, "statuses": {}}
+
+# Merge counts taken at timestamp `at` into a bucket's: the newer value of each field wins
+def merge_counts(bucket, counts, at):
+    if bucket["counts_at"] is None or at >= bucket["counts_at"]:
+        bucket["counts"].update(counts)
+        bucket["counts_at"] = at
+    else:
+        for name, value in counts.items():
+            bucket["counts"].setdefault(name, value)
+
+# Histogram bin of a value (as a string, since the state is stored as JSON)
+def value_bin(value):
+    return str(math.floor(math.log(max(value, BIN_FLOOR), BIN_GROWTH)))
+
+def add_time(times, name, value):
+    state = times.get(name)
+    if state is None:
+        times[name] = {"n": 1, "sum": value, "min": value, "max": value, "bins": {value_bin(value): 1}}
+        return
+    state["n"] += 1
+    state["sum"] += value
+    state["min"] = min(state["min"], value)
+    state["max"] = max(state["max"], value)
+    index = value_bin(value)
+    state["bins"][index] = state["bins"].get(index, 0) + 1
+
+# Fold one metrics record into a bucket
+def add_to_bucket(bucket, record):
+    bucket["runs"] += 1
+    if record.get("status"):
+        bucket["statuses"][record["status"]] = bucket["statuses"].get(record["status"], 0) + 1
+    counts = {}
+    for name, value in record.items():
+        if not isinstance(value, (int, float)) or isinstance(value, bool):
+            continue
+        if is_count_field(name):
+            counts[name] = value
+        elif is_time_field(name):
+            add_time(bucket["times"], name, value)
+    if counts:
+        # ISO timestamps compare correctly as strings
+        merge_counts(bucket, counts, record["timestamp"])
+
+# Merge bucket `later` (same start and profile, later in the file) into `bucket`
+def merge_buckets(bucket, later):
+    bucket["runs"] += later["runs"]
+    if later["counts"]:
+        merge_counts(bucket, later["counts"], later["counts_at"])
+    for status, runs in later["statuses"].items():
+        bucket["statuses"][status] = bucket["statuses"].get(status, 0) + runs
+    for name, other in later["times"].items():
+        state = bucket["times"].get(name)
+        if state is None:
+            bucket["times"][name] = other
+            continue
+        state["n"] += other["n"]
+        state["sum"] += other["sum"]
+        state["min"] = min(state["min"], other["min"])
+        state["max"] = max(state["max"], other["max"])
+        for index, count in other["bins"].items():
+            state["bins"][index] = state["bins"].get(index, 0) + count
+
+# Estimated value at `fraction` of a time field's histogram: the middle of the bin holding
+# the rank percentile() would pick, kept within the exact min and max
+def state_percentile(state, fraction):
+    rank = int(round(fraction * (state["n"] - 1)))
+    seen = 0
+    for index in sorted(state["bins"], key=int):
+        seen += state["bins"][index]
+        if seen > rank:
+            middle = BIN_GROWTH ** (int(index) + 0.5)
+            return min(max(middle, state["min"]), state["max"])
+    return state["max"]
+
+def empty_rollups():
+    return {"version": ROLLUP_VERSION, "closed_size": 0, "open": {resolution: {} for resolution in RESOLUTIONS}}
+
+# Fold a record into the open buckets of `rollups`; returns the buckets it closed (or
+# that it went into when older than the open one) as (resolution, bucket) pairs
+def add_record(rollups, record):
+    timestamp = datetime.datetime.fromisoformat(record["timestamp"])
+    profile = record.get("profile") or ""
+    closed = []
+    for resolution in RESOLUTIONS:
+        start = bucket_start(timestamp, resolution)
+        open_buckets = rollups["open"][resolution]
+        bucket = open_buckets.get(profile)
+        if bucket is None or bucket["start"] < start:
+            if bucket is not None:
+                closed.append((resolution, bucket))
+            bucket = open_buckets[profile] = new_bucket(start, profile)
+        elif bucket["start"] > start:
+            # Out of order (e.g. the clock moved back): a bucket of its own, merged when loaded
+            bucket = new_bucket(start, profile)
+            closed.append((resolution, bucket))
+        add_to_bucket(bucket, record)
+    return closed
+
+def load_rollup_file(file_path):
+    rollup_path = rollup_path_for(file_path)
+    if os.path.exists(rollup_path):
+        with open(rollup_path, "r", encoding="UTF-8") as file:
+            rollups = json.load(file)
+        # Files from an older layout are rebuilt
+        if rollups.get("version") == ROLLUP_VERSION:
+            return rollups
+    return None
+
+def save_rollup_file(file_path, rollups):
+    rollup_path = rollup_path_for(file_path)
+    temp_path = f"{rollup_path}.tmp"
+    with open(temp_path, "w", encoding="UTF-8") as file:
+        json.dump(rollups, file, ensure_ascii=False)
+    os.replace(temp_path, rollup_path)
+
+# Append closed buckets after the committed part of the .jsonl, returning its new size
+def append_closed(file_path, closed, closed_size):
+    with open(closed_path_for(file_path), "a+b") as file:
+        file.truncate(closed_size)
+        for resolution, bucket in closed:
+            file.write((json.dumps({"resolution": resolution, **bucket}, ensure_ascii=False) + "\n").encode("UTF-8"))
+        file.flush()
+        os.fsync(file.fileno())
+        return file.tell()
+
+# Recompute all rollups from the raw metrics (first run, or after an upgrade)
+def rebuild_rollups(file_path):
+    rollups = empty_rollups()
+    closed = []
+    for record in load_metrics(file_path):
+        closed.extend(add_record(rollups, record))
+    rollups["closed_size"] = append_closed(file_path, closed, 0)
+    save_rollup_file(file_path, rollups)
+    return rollups
+
+# Update the rollups of file_path with a record that has just been appended to it
+def update_rollups(file_path, record):
+    rollups = load_rollup_file(file_path)
+    if rollups is None:
+        # The record is already in the metrics file, so the rebuild includes it
+        rebuild_rollups(file_path)
+        return
+    closed = add_record(rollups, record)
+    if closed:
+        rollups["closed_size"] = append_closed(file_path, closed, rollups["closed_size"])
+    save_rollup_file(file_path, rollups)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+# All buckets of one resolution: the committed closed buckets, then the open ones
+def read_buckets(file_path, rollups, resolution):
+    buckets = {}
+    closed_path = closed_path_for(file_path)
+    if os.path.exists(closed_path):
+        with open(closed_path, "rb") as file:
+            for line in file.read(rollups["closed_size"]).splitlines():
+                bucket = json.loads(line)
+                if bucket.pop("resolution") != resolution:
+                    continue
+                key = bucket_key(bucket)
+                if key in buckets:
+                    merge_buckets(buckets[key], bucket)
+                else:
+                    buckets[key] = bucket
+    for bucket in rollups["open"].get(resolution, {}).values():
+        key = bucket_key(bucket)
+        if key in buckets:
+            merge_buckets(buckets[key], bucket)
+        else:
+            buckets[key] = bucket
+    return buckets.values()
+
+# Rollup buckets as flat records shaped like raw metrics records: counts keep their names,
+# time fields hold the mean with _min, _max and _p95 alongside, timestamp is the bucket start.
+# start and end (datetimes) limit the buckets returned.
+def load_rollups(file_path, resolution, start=None, end=None):
+    rollups = load_rollup_file(file_path)
+    if rollups is None:
+        if not os.path.exists(file_path):
+            return []
+        rollups = rebuild_rollups(file_path)
+    records = []
+    for bucket in read_buckets(file_path, rollups, resolution):
+        # ISO dates compare correctly as strings
+        if start and bucket["start"] < bucket_start(start, resolution):
+            continue
+        if end and bucket["start"] > end.date().isoformat():
+            continue
+        record = {"timestamp": bucket["start"], "runs": bucket["runs"], **bucket["counts"]}
+        if bucket["profile"]:
+            record["profile"] = bucket["profile"]
+        for status, runs in bucket["statuses"].items():
+            record[f"status_{status}_runs"] = runs
+        for name, state in bucket["times"].items():
+            record[name] = state["sum"] / state["n"]
+            record[f"{name}_min"] = state["min"]
+            record[f"{name}_max"] = state["max"]
+            record[f"{name}_p95"] = state_percentile(state, 0.95)
+        records.append(record)
+    records.sort(key=lambda record: record["timestamp"])
+    return records
@@ -0,0 +1,115 @@
+import datetime
+import json
+import logging
+import os
+
+# Metrics are stored as JSON Lines: one record per run, appended in time order.
+# The old scripts wrote a single JSON array (metrics.json), which is migrated on first use.
+# The scripts stamp each record just before appending it, but timestamps are naive local
+# times and runs from different processes can interleave, so the order only holds to within
+# ORDER_SLACK (which also covers the hour the clock goes back at the end of summer time).
+# Reads for a time range look that far past its edges and filter each record.
+
+ORDER_SLACK = datetime.timedelta(hours=2)
+
+# Path of the legacy JSON array file that matches a JSON Lines metrics file
+def legacy_path_for(file_path):
+    return os.path.splitext(file_path)[0] + ".json"
+
+# Convert a legacy JSON array metrics file into JSON Lines, keeping the old file as .bak
+def migrate_legacy_metrics(file_path, legacy_path=None):
+    legacy_path = legacy_path or legacy_path_for(file_path)
+    if os.path.exists(file_path) or not os.path.exists(legacy_path):
+        return 0
+    with open(legacy_path, "r", encoding="UTF-8") as legacy_file:
+        records = json.load(legacy_file)
+    if not isinstance(records, list):
+        records = [records]
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w", encoding="UTF-8") as file:
+        for record in records:
+            file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+    os.replace(legacy_path, f"{legacy_path}.bak")
+    logging.info(f"Migrated {len(records)} metrics records from {legacy_path} to {file_path}")
+    return len(records)
+
+# Append one metrics record as a single line; a crash can at most lose that line
+def append_metrics(file_path, record):
+    migrate_legacy_metrics(file_path)
+    line = json.dumps(record, ensure_ascii=False) + "\n"
+    with open(file_path, "a", encoding="UTF-8") as file:
+        file.write(line)
+        file.flush()
+        os.fsync(file.fileno())
+    logging.info(f"Metrics appended to {file_path}")
+    # metrics_rollup reads through this module, so import it here to avoid a cycle
+    from metrics_rollup import update_rollups
+    update_rollups(file_path, record)
+
+# Timestamp of a JSON Lines record, or None for a partially written line
+def _record_timestamp(line):
+    try:
+        return datetime.datetime.fromisoformat(json.loads(line)["timestamp"])
+    except (json.JSONDecodeError, KeyError, ValueError):
+        return None
+
+# Move to the first line at or after offset (offset 0 is always a line start)
+def _seek_line(file, offset):
+    if offset == 0:
+        file.seek(0)
+    else:
+        file.seek(offset - 1)
+        file.readline()
+
+# Records are appended in time order (to within ORDER_SLACK), so bisect over byte offsets
+# to find the first record at or after start instead of parsing the whole history
+def _seek_to_start(file, start):
+    lo, hi = 0, os.fstat(file.fileno()).st_size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        _seek_line(file, mid)
+        timestamp = _record_timestamp(file.readline())
+        if timestamp is None or timestamp >= start:
+            hi = mid
+        else:
+            lo = mid + 1
+    _seek_line(file, lo)
+
+# Load metrics records, optionally only those with start <= timestamp <= end
+def load_metrics(file_path, start=None, end=None):
+    legacy_path = legacy_path_for(file_path)
+    if not os.path.exists(file_path) and os.path.exists(legacy_path):
+        # Not migrated yet (the scripts have not run since upgrading), read the old array
+        with open(legacy_path, "r", encoding="UTF-8") as legacy_file:
+            records = json.load(legacy_file)
+        if not isinstance(records, list):
+            records = [records]
+        return [
+            record for record in records
+            if (not start or datetime.datetime.fromisoformat(record["timestamp"]) >= start)
+            and (not end or datetime.datetime.fromisoformat(record["timestamp"]) <= end)
+        ]
+    if not os.path.exists(file_path):
+        return []
+
+    metrics = []
+    with open(file_path, "rb") as file:
+        if start:
+            _seek_to_start(file, start - ORDER_SLACK)
+        for line in file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Partially written last line from an interrupted run
+                continue
+            if start or end:
+                timestamp = datetime.datetime.fromisoformat(record["timestamp"])
+                if end and timestamp > end + ORDER_SLACK:
+                    break
+                if (start and timestamp < start) or (end and timestamp > end):
+                    continue
+            metrics.append(record)
+    return metrics
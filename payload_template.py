@@ -0,0 +1,161 @@
+import datetime
+import string
+from events import group_by_day
+
+# Webhook payload templates. A template names the event buckets (horizons) it needs
+# and maps each payload key to a section. compile_template() checks every format string
+# and binds it once; collect() looks each bucket up once through the EventIndex and
+# render() fills all sections from the buckets, so a new section never adds a pass over
+# the events. Both can be configured in schedule.json ("payload").
+#
+# Buckets ("buckets": {name: spec}):
+#   {"days": [first, last]}   events from `first` to `last` days after today
+#   {"next_weekday": n}       events on the next weekday n (0 = Monday) after today
+#   {"until_exam": true}      events from tomorrow up to the day of the nearest upcoming exam
+#   {"next": k}               the next k events from now
+# Sections ("sections": {payload key: spec}):
+#   {"list": source, "item": format, "empty": text}
+#       numbered lines, one per item of a bucket or of "exams" (the upcoming exams);
+#       event fields: number, name, weekday, date; exam fields: number, name, date, days, weeks.
+#       With "day": format (fields date, count), bucket events are listed in date order
+#       under one header line per day and numbered within the day.
+#   {"text": format}   a string from the run's fields (see CONTEXT_FIELDS)
+#   {"value": field}   a run field as is, so numbers stay numbers
+#   Any section can add "weekdays": [...] to render only when today is one of those
+#   weekdays, sending "otherwise" (default "None") on the other days.
+
+EVENT_FIELDS = {'number', 'name', 'weekday', 'date'}
+EXAM_FIELDS = {'number', 'name', 'date', 'days', 'weeks'}
+DAY_FIELDS = {'date', 'count'}
+BUCKET_KINDS = ('days', 'next_weekday', 'until_exam', 'next')
+CONTEXT_FIELDS = {'today', 'classes_tomorrow', 'test_name', 'days_til_test', 'weeks_til_test'}
+
+# The payload the Make scenario expects; keys and types must not change without updating
+# the scenario. Other sections are opt-in through "payload", e.g. the upcoming exams:
+#   "upcoming_tests": {"list": "exams", "item": "   {name}: {days} 天", "empty": "沒有即將到來的考試！"}
+# or a day-by-day agenda up to the exam:
+#   "buckets": {"exam": {"until_exam": true}},
+#   "sections": {"reminders_until_test": {"list": "exam", "day": "{date:%m/%d}", "item": "   {number}. {name}"}}
+DEFAULT_TEMPLATE = {
+    'buckets': {
+        'tomorrow': {'days': [1, 1]},
+        '3days': {'days': [2, 3]},
+        'monday': {'next_weekday': 0},
+    },
+    'sections': {
+        'classes_tomorrow': {'text': '{classes_tomorrow}'},
+        'reminders_tomorrow': {'list': 'tomorrow', 'item': '   {number}. {name}', 'empty': '明天沒有任何提醒事項！'},
+        'reminders_week': {'list': '3days', 'item': '   {number}. {name} ({weekday})', 'empty': '三天內沒有任何提醒事項！'},
+        # Only sent on Fridays
+        'reminders_monday': {'list': 'monday', 'item': '   {number}. {name}', 'empty': '', 'weekdays': [4]},
+        'days_til_test': {'value': 'days_til_test'},
+        'weeks_til_test': {'value': 'weeks_til_test'},
+    },
+}
+
+# Bound str.format of a format string, after checking it only uses `fields`
+def compile_format(text, fields, where):
+    for _, field, _, _ in string.Formatter().parse(text):
+        if field is not None and field.split('.')[0].split('[')[0] not in fields:
+            raise ValueError(f"Unknown field {{{field}}} in {where}, expected one of {sorted(fields)}")
+    return text.format
+
+# Day window [start, end] of a day-window bucket for `today` (a date), None when it is empty
+def bucket_window(spec, today, exams):
+    if 'days' in spec:
+        first, last = spec['days']
+        return today + datetime.timedelta(days=first), today + datetime.timedelta(days=last)
+    if 'next_weekday' in spec:
+        days_ahead = (spec['next_weekday'] - today.weekday() - 1) % 7 + 1
+        day = today + datetime.timedelta(days=days_ahead)
+        return day, day
+    # until_exam
+    if not exams:
+        return None
+    return today + datetime.timedelta(days=1), exams[0]['date']
+
+# Numbered lines for a list of events
+def event_lines(item_format, events):
+    return [item_format(number=number, name=event.name, weekday=event.weekday, date=event.date)
+            for number, event in enumerate(events, 1)]
+
+class CompiledTemplate:
+    def __init__(self, template):
+        self.buckets = {}
+        for name, spec in template['buckets'].items():
+            if not any(kind in spec for kind in BUCKET_KINDS):
+                raise ValueError(f"Bucket {name!r} needs one of {', '.join(BUCKET_KINDS)}")
+            self.buckets[name] = spec
+
+        # Buckets that some section lists by day
+        self.grouped = set()
+        self.sections = []
+        for key, spec in template['sections'].items():
+            where = f"payload section {key!r}"
+            if 'list' in spec:
+                source = spec['list']
+                if source != 'exams' and source not in self.buckets:
+                    raise ValueError(f"Unknown bucket {source!r} in {where}")
+                fields = EXAM_FIELDS if source == 'exams' else EVENT_FIELDS
+                day_format = None
+                if 'day' in spec:
+                    if source == 'exams':
+                        raise ValueError(f"'day' needs an event bucket in {where}")
+                    day_format = compile_format(spec['day'], DAY_FIELDS, where)
+                    self.grouped.add(source)
+                renderer = ('list', source, compile_format(spec['item'], fields, where), spec.get('empty', ''), day_format)
+            elif 'text' in spec:
+                renderer = ('text', compile_format(spec['text'], CONTEXT_FIELDS, where))
+            elif 'value' in spec:
+                if spec['value'] not in CONTEXT_FIELDS:
+                    raise ValueError(f"Unknown field {spec['value']!r} in {where}")
+                renderer = ('value', spec['value'])
+            else:
+                raise ValueError(f"{where} needs 'list', 'text' or 'value'")
+            weekdays = set(spec['weekdays']) if 'weekdays' in spec else None
+            self.sections.append((key, renderer, weekdays, spec.get('otherwise', 'None')))
+
+    # Events of every bucket for `today` (the run's datetime) from an EventIndex, one lookup
+    # per bucket. Returns ({name: events in CSV order}, {name: [(day, events)]} for grouped buckets).
+    def collect(self, index, today, exams):
+        buckets = {}
+        groups = {}
+        for name, spec in self.buckets.items():
+            if 'next' in spec:
+                buckets[name] = index.next_n(spec['next'], today)
+                if name in self.grouped:
+                    groups[name] = group_by_day(buckets[name])
+                continue
+            window = bucket_window(spec, today.date(), exams)
+            buckets[name] = index.events_between(*window) if window else []
+            if name in self.grouped:
+                groups[name] = index.group_by_day(*window) if window else []
+        return buckets, groups
+
+    # Build the payload from the collected buckets, the upcoming exams and the run's fields
+    def render(self, buckets, groups, exams, context):
+        lists = dict(buckets, exams=exams)
+        payload = {}
+        for key, renderer, weekdays, otherwise in self.sections:
+            if weekdays is not None and context['today'].weekday() not in weekdays:
+                payload[key] = otherwise
+            elif renderer[0] == 'list':
+                _, source, item_format, empty, day_format = renderer
+                if source == 'exams':
+                    lines = [item_format(number=number, **exam) for number, exam in enumerate(lists[source], 1)]
+                elif day_format:
+                    lines = []
+                    for day, events in groups[source]:
+                        lines.append(day_format(date=day, count=len(events)))
+                        lines.extend(event_lines(item_format, events))
+                else:
+                    lines = event_lines(item_format, lists[source])
+                payload[key] = "\n".join(lines) or empty
+            elif renderer[0] == 'text':
+                payload[key] = renderer[1](**context)
+            else:
+                payload[key] = context[renderer[1]]
+        return payload
+
+def compile_template(template=None):
+    return CompiledTemplate(template or DEFAULT_TEMPLATE)
@@ -1,12 +1,17 @@
-import csv
+import argparse
 import datetime
-import requests
 from dotenv import load_dotenv
 import os
 import json
 import logging
+import re
 import time
-import psutil
+from events import EventIndex, read_events
+from metrics_store import append_metrics
+from schedule import exam_countdowns, load_schedule, load_timetable, payload_countdown
+from supervisor import RunLock, RunLocked, Supervisor, deadlines_from_env
+from timing import TRACE_MEMORY, Timer
+from webhook import OUTBOX_PATH, deliver, replay_outbox
 
 # Configure logging
 logging.basicConfig(
@@ -19,142 +24,303 @@ load_dotenv()
 
 webhook_url = os.getenv('MAKE_WEBHOOK_URL')
 
-# Dictionary mapping weekdays to subject names
-weekday_subjects = {
-    0: '   機器人/生物 \n   機器人/生物 \n   國文 \n   數學 \n   英文作文 \n   英文作文 \n   自然充實 \n   數學',       # Monday
-    1: '   數學 \n   物理 \n   化學 \n   化學 \n   體育 \n   數學 \n   國文 \n   國文',    # Tuesday
-    2: '   國文 \n   全民國防教育 \n   英文 \n   化學 \n   班會 \n   團體活動 \n   地科 \n   化學',    # Wednesday
-    3: '   家政 \n   家政 \n   本土語 \n   物理 \n   國文 \n   健康與護理 \n   數學 \n   英文',        # Thursday
-    4: '   進階程設/生物 \n   進階程設/生物 \n   英文 \n   體育 \n   國文 \n   物理 \n   數學 \n   物理', # Friday
-    5: '   不用上課！',      # Saturday
-    6: '   不用上課！'    # Sunday
-}
-
-def read_csv(file_path):
-    start_time = time.time()
-    logging.info(f"Reading events from CSV file: {file_path}")
-    events = []
-    with open(file_path, mode='r', encoding='UTF-8') as file:
-        reader = csv.DictReader(file)
-        i = 1
-        for row in reader:
-            logging.debug(f"Reading row {i}")
-            event_name = row['Event name'].strip()
-            event_date = datetime.datetime.strptime(row['Event date and time'].strip(), '%m/%d/%Y %H:%M:%S')
-            event_weekday = row['Weekday'].strip()
-            events.append({'name': event_name, 'date': event_date, 'weekday': event_weekday})
-            i += 1
-    end_time = time.time()
-    logging.info(f"Read {i} events from CSV file in {end_time - start_time:.4f} seconds.")
-    return events
-
-def is_event_tomorrow(event_date):
-    today = datetime.datetime.now()
-    tomorrow = today + datetime.timedelta(days=1)
-    return event_date.date() == tomorrow.date()
+METRICS_FILE_PATH = 'metrics.jsonl'
+# Set REMINDERS_METRICS=0 to skip metrics; psutil is then never imported
+METRICS_ENABLED = os.getenv('REMINDERS_METRICS', '1') != '0'
+# Timetable, exam dates and payload template (see schedule.py)
+SCHEDULE_PATH = os.getenv('REMINDERS_SCHEDULE', 'schedule.json')
 
-def is_event_in_3_days(event_date):
-    today = datetime.datetime.now()
-    three_days_later = today + datetime.timedelta(days=3)
-    return today.date() < event_date.date() <= three_days_later.date()
+# Loaded schedule and the file signature it was loaded at
+_schedule = (None, None)
 
-def is_event_on_next_monday(event_date):
-    today = datetime.datetime.now()
-    monday = today + datetime.timedelta(days=(7 - today.weekday()))
-    return event_date.date() == monday.date()
+# Keeps cron, daemon and --profiles runs from overlapping (see supervisor.py)
+LOCK_FILE_PATH = 'reminders.lock'
+# Per-stage deadlines in seconds; the webhook stage includes retries and outbox replays
+STAGE_DEADLINES = {'parse': 60, 'index': 30, 'payload': 30, 'webhook': 300, 'dispatch': 300}
+# Daemon mode retries payloads left in the outbox this often between scheduled runs
+OUTBOX_RETRY_INTERVAL = datetime.timedelta(minutes=float(os.getenv('WEBHOOK_OUTBOX_RETRY_MINUTES', '10')))
 
 def call_webhook(payload):
-    response = requests.post(webhook_url, json=payload)
-    if response.status_code == 200:
-        logging.info("Successfully called webhook")
-    else:
-        logging.error(f"Failed to call webhook: {response.status_code}")
+    return deliver(webhook_url, payload)
+
+# Load the schedule, reloading it only when the file has changed (daemon mode keeps it)
+def get_schedule(file_path=None):
+    global _schedule
+    file_path = file_path or SCHEDULE_PATH
+    signature = file_signature(file_path)
+    if _schedule[0] != signature:
+        _schedule = (signature, load_schedule(file_path))
+        logging.info(f"Loaded schedule from {file_path}")
+    return _schedule[1]
 
-def check_events(csv_file_path):
+# Build the webhook payload for `today` from an EventIndex, plus the reminder counts for metrics.
+# Each template bucket is one index lookup; the sections are rendered from the buckets.
+def build_payload(index, today, schedule):
+    template = schedule['template']
+    countdowns = exam_countdowns(schedule['exams'], today)
+    buckets, groups = template.collect(index, today, countdowns)
+    next_exam = payload_countdown(schedule['exams'], countdowns, today)
+    tomorrow = today + datetime.timedelta(days=1)
+    context = {
+        'today': today,
+        'classes_tomorrow': schedule['timetable'].get(tomorrow.weekday(), ''),
+        'test_name': next_exam['name'],
+        'days_til_test': next_exam['days'],
+        'weeks_til_test': next_exam['weeks'],
+    }
+    payload = template.render(buckets, groups, countdowns, context)
+
+    counts = {f"reminders_{name}_count": len(bucket) for name, bucket in buckets.items()}
+    counts['total_reminders_count'] = len(index)
+    return payload, counts
+
+# Metrics record for a run that did not complete: skipped because another run held the
+# lock, or timed out / aborted by the supervisor
+def record_failed_run(record):
+    if METRICS_ENABLED:
+        append_metrics(METRICS_FILE_PATH, {'timestamp': datetime.datetime.now().isoformat(), **record})
+
+# `index` is an EventIndex already built from csv_file_path (daemon mode); without it the
+# CSV is parsed and indexed here. With exit_on_abort=False a run that breaks a deadline or
+# the memory ceiling raises RunAborted instead of ending the process.
+def check_events(csv_file_path, index=None, exit_on_abort=True):
     start_time = time.time()
     logging.info(f"Startup time: {start_time}")
-    process = psutil.Process(os.getpid())
-    logging.debug(f"Process ID: {process}")
-    mem_before = process.memory_info().rss / 1024 / 1024  # in MB
-    logging.debug(f"Memory usage before: {mem_before:.2f} MB")
+    if METRICS_ENABLED:
+        import psutil
+        process = psutil.Process(os.getpid())
+        logging.debug(f"Process ID: {process}")
+        mem_before = process.memory_info().rss / 1024 / 1024  # in MB
+        logging.debug(f"Memory usage before: {mem_before:.2f} MB")
 
-    events = read_csv(csv_file_path)
-    reminders_tomorrow = []
-    reminders_3days = []
-    reminders_monday=[]
+    timer = Timer(trace_memory=METRICS_ENABLED and TRACE_MEMORY)
+    try:
+        with Supervisor(LOCK_FILE_PATH, deadlines_from_env(STAGE_DEADLINES), timer=timer,
+                        on_abort=record_failed_run, exit_on_abort=exit_on_abort) as supervisor:
+            if index is None:
+                with supervisor.stage('parse'):
+                    events = read_events(csv_file_path)
+                with supervisor.stage('index'):
+                    index = EventIndex(events)
 
-    logging.info("Setting up dates...")
+            logging.info("Checking events...")
+            today = datetime.datetime.now()
+            with supervisor.stage('payload'):
+                payload, counts = build_payload(index, today, get_schedule())
+            with supervisor.stage('webhook'):
+                delivery = call_webhook(payload)
+    except RunLocked as e:
+        logging.warning(f"Skipping this run: {e}")
+        record_failed_run({'status': 'skipped', 'abort_reason': str(e)})
+        return
+    finally:
+        timer.stop()
 
-    today = datetime.datetime.now()
-    tomorrow = today + datetime.timedelta(days=1)
-    classes_tomorrow = weekday_subjects[tomorrow.weekday()]
-
-    logging.info("Checking events...")
-    for event in events:
-        if is_event_on_next_monday(event['date']):
-            reminders_monday.append(f"{event['name']}")
-        if is_event_tomorrow(event['date']):
-            reminders_tomorrow.append(f"{event['name']}")
-        elif is_event_in_3_days(event['date']):
-            reminders_3days.append(f"{event['name']} ({event['weekday']})")
-
-    # Number the reminders and join with newline characters
-    reminders_tomorrow = "\n".join([f"   {i+1}. {reminder}" for i, reminder in enumerate(reminders_tomorrow)])
-    reminders_3days = "\n".join([f"   {i+1}. {reminder}" for i, reminder in enumerate(reminders_3days)])
-    reminders_monday = "\n".join([f"   {i+1}. {reminder}" for i, reminder in enumerate(reminders_monday)])
-
-    if reminders_tomorrow == "":
-        reminders_tomorrow = "明天沒有任何提醒事項！"
-    if reminders_3days == "":
-        reminders_3days = "三天內沒有任何提醒事項！"
-
-    days_until_test = (datetime.datetime(2025, 1, 18) - today).days
-    weeks_until_test = days_until_test // 7
-
-    payload = {
-        'classes_tomorrow': classes_tomorrow,
-        'reminders_tomorrow': reminders_tomorrow,
-        'reminders_week': reminders_3days,
-        'reminders_monday': reminders_monday if today.weekday() == 4 else "None",
-        'days_til_test': days_until_test,
-        'weeks_til_test': weeks_until_test
-    }
-    call_webhook(payload)
-
-    mem_after = process.memory_info().rss / 1024 / 1024  # in MB
     end_time = time.time()
+    logging.info(f"check_events execution time: {end_time - start_time:.2f} seconds ({timer.describe()})")
+    if not METRICS_ENABLED:
+        return
+    mem_after = process.memory_info().rss / 1024 / 1024  # in MB
 
-    # Save metrics to a JSON file with timestamp
+    # Append metrics to the JSON Lines metrics file, stamped now rather than with `today`
+    # so records stay in the order they are appended (see metrics_store.py)
     metrics = {
-        'timestamp': today.isoformat(),
-        'reminders_tomorrow_count': len(reminders_tomorrow.split('\n')) if reminders_tomorrow != "明天沒有任何提醒事項！" else 0,
-        'reminders_3days_count': len(reminders_3days.split('\n')) if reminders_3days != "三天內沒有任何提醒事項！" else 0,
-        'total_reminders_count': len(events),
+        'timestamp': datetime.datetime.now().isoformat(),
+        'status': 'ok',
+        **counts,
         'execution_time': end_time - start_time,
-        'memory_delta': mem_after - mem_before
+        'memory_delta': mem_after - mem_before,
+        **timer.metrics(),
+        **delivery
     }
-    metrics_file_path = 'metrics.json'
-    if os.path.exists(metrics_file_path):
-        with open(metrics_file_path, 'r') as metrics_file:
-            all_metrics = json.load(metrics_file)
-            if not isinstance(all_metrics, list):
-                all_metrics = [all_metrics]
-    else:
-        all_metrics = []
+    append_metrics(METRICS_FILE_PATH, metrics)
+    logging.info(f"Memory usage before: {mem_before:.2f} MB, after: {mem_after:.2f} MB, difference: {mem_after - mem_before:.2f} MB")
 
-    all_metrics.append(metrics)
+# Load the profiles config: {"profiles": [{"name", "csv", "webhook_url" or "webhook_url_env", "timetable"}]}
+# "csv" defaults to reminders.csv, the webhook to $MAKE_WEBHOOK_URL and the timetable to the schedule's.
+# Names must be unique and safe in a file name, since each profile has its own outbox file.
+def load_profiles(config_path):
+    with open(config_path, 'r', encoding='UTF-8') as file:
+        config = json.load(file)
+    profiles = []
+    names = set()
+    for profile in config['profiles']:
+        name = profile['name']
+        if not isinstance(name, str) or not re.fullmatch(r'[\w-]+', name):
+            raise ValueError(f"Profile name {name!r} in {config_path} may only use letters, digits, '_' and '-'")
+        if name in names:
+            raise ValueError(f"Profile name {name!r} is used more than once in {config_path}")
+        names.add(name)
+        timetable = profile.get('timetable')
+        profiles.append({
+            'name': name,
+            'csv': profile.get('csv', 'reminders.csv'),
+            'webhook_url': profile.get('webhook_url') or os.getenv(profile.get('webhook_url_env', 'MAKE_WEBHOOK_URL')),
+            'timetable': load_timetable(timetable) if timetable else None,
+        })
+    return profiles
 
-    with open(metrics_file_path, 'w') as metrics_file:
-        json.dump(all_metrics, metrics_file, indent=4)
+# Build and deliver one profile's payload; runs on a worker thread
+def dispatch_profile(profile, index, today, schedule):
+    start_time = time.perf_counter()
+    if profile['timetable']:
+        schedule = dict(schedule, timetable=profile['timetable'])
+    # tracemalloc is process-wide, so peaks from concurrent profiles would be meaningless
+    timer = Timer(trace_memory=False)
+    with timer.span('payload'):
+        payload, counts = build_payload(index, today, schedule)
+    with timer.span('webhook'):
+        # Each profile gets its own outbox so concurrent deliveries never share a file
+        delivery = deliver(profile['webhook_url'], payload, outbox_path=f"webhook_outbox_{profile['name']}.jsonl")
+    return {
+        'profile': profile['name'],
+        **counts,
+        'execution_time': time.perf_counter() - start_time,
+        **timer.metrics(),
+        **delivery
+    }
 
-    logging.info(f"Metrics saved to {metrics_file_path}")
-    logging.info(f"check_events execution time: {end_time - start_time:.2f} seconds")
-    logging.info(f"Memory usage before: {mem_before:.2f} MB, after: {mem_after:.2f} MB, difference: {mem_after - mem_before:.2f} MB")
+# Send reminders for every configured profile from one process. Each CSV is parsed
+# once and shared between the profiles that use it, then payloads are dispatched concurrently.
+def check_profiles(config_path):
+    import concurrent.futures
+    start_time = time.perf_counter()
+    profiles = load_profiles(config_path)
+    logging.info(f"Loaded {len(profiles)} profiles from {config_path}")
+
+    # Parsing is shared by all profiles, so its stages go into every profile's record
+    timer = Timer(trace_memory=METRICS_ENABLED and TRACE_MEMORY)
+    try:
+        with Supervisor(LOCK_FILE_PATH, deadlines_from_env(STAGE_DEADLINES), timer=timer,
+                        on_abort=record_failed_run) as supervisor:
+            indexes = {}
+            for profile in profiles:
+                if profile['csv'] not in indexes:
+                    with supervisor.stage('parse'):
+                        events = read_events(profile['csv'])
+                    with supervisor.stage('index'):
+                        indexes[profile['csv']] = EventIndex(events)
+            timer.stop()
+            parse_time = time.perf_counter() - start_time
+            shared_metrics = timer.metrics()
+
+            schedule = get_schedule()
+            today = datetime.datetime.now()
+            # One deadline for all profiles; each delivery also has its own timeouts
+            with supervisor.stage('dispatch'), \
+                    concurrent.futures.ThreadPoolExecutor(max_workers=len(profiles) or 1) as executor:
+                futures = {executor.submit(dispatch_profile, profile, indexes[profile['csv']], today, schedule): profile
+                           for profile in profiles}
+                for future in concurrent.futures.as_completed(futures):
+                    name = futures[future]['name']
+                    try:
+                        metrics = future.result()
+                    except Exception as e:
+                        logging.exception(f"Profile {name} failed: {e}")
+                        record_failed_run({'profile': name, 'status': 'failed', 'abort_reason': str(e),
+                                           'parse_time': parse_time, **shared_metrics})
+                        continue
+                    # Stamped as it is appended, so records stay in order (see metrics_store.py)
+                    metrics = {'timestamp': datetime.datetime.now().isoformat(), 'status': 'ok', **metrics}
+                    metrics['parse_time'] = parse_time
+                    metrics.update(shared_metrics)
+                    if METRICS_ENABLED:
+                        append_metrics(METRICS_FILE_PATH, metrics)
+                    logging.info(f"Profile {name} done in {metrics['execution_time']:.4f} seconds")
+    except RunLocked as e:
+        logging.warning(f"Skipping this run: {e}")
+        record_failed_run({'status': 'skipped', 'abort_reason': str(e)})
+        return
+    finally:
+        timer.stop()
+    logging.info(f"check_profiles execution time: {time.perf_counter() - start_time:.2f} seconds")
+
+# Signature of the CSV file, used to notice when the downloader has rewritten it
+def file_signature(file_path):
+    stat = os.stat(file_path)
+    return stat.st_mtime_ns, stat.st_size
+
+# Next datetime after `now` matching one of the "HH:MM" schedule times
+def next_run_time(now, times):
+    candidates = []
+    for run_at in times:
+        hour, minute = (int(part) for part in run_at.split(':'))
+        candidate = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if candidate <= now:
+            candidate += datetime.timedelta(days=1)
+        candidates.append(candidate)
+    return min(candidates)
+
+# Replay the payloads queued in the outbox, unless a run holds the lock (its delivery
+# replays them anyway)
+def retry_outbox():
+    if not os.path.exists(OUTBOX_PATH):
+        return
+    lock = RunLock(LOCK_FILE_PATH)
+    if not lock.acquire():
+        return
+    try:
+        delivery = replay_outbox()
+    finally:
+        lock.release()
+    logging.info(f"Outbox retry: {delivery['outbox_replayed']} replayed, {delivery['outbox_pending']} pending")
+
+# Stay resident, keep the indexed events in memory and only re-read the CSV when it changes.
+# Payloads that failed are retried every OUTBOX_RETRY_INTERVAL, so they can still go out the
+# same day rather than waiting for the next scheduled run.
+def run_daemon(csv_file_path, times, poll_interval):
+    logging.info(f"Starting daemon mode, scheduled at {', '.join(times)}")
+    signature = None
+    index = None
+    next_retry = datetime.datetime.now() + OUTBOX_RETRY_INTERVAL
+    next_run = next_run_time(datetime.datetime.now(), times)
+    logging.info(f"Next run at {next_run.isoformat()}")
+    while True:
+        try:
+            current_signature = file_signature(csv_file_path)
+            if current_signature != signature:
+                logging.info(f"{csv_file_path} changed, reloading events")
+                index = EventIndex(read_events(csv_file_path))
+                signature = current_signature
+        except (OSError, ValueError, KeyError, IndexError) as e:
+            # Keep the previous events if the file is missing, mid-rewrite or has a short row
+            logging.error(f"Failed to reload {csv_file_path}: {e}")
+
+        now = datetime.datetime.now()
+        if now >= next_run:
+            if index is not None:
+                try:
+                    check_events(csv_file_path, index, exit_on_abort=False)
+                except Exception as e:
+                    logging.exception(f"Scheduled check failed: {e}")
+            next_run = next_run_time(now, times)
+            logging.info(f"Next run at {next_run.isoformat()}")
+        elif now >= next_retry:
+            try:
+                retry_outbox()
+            except Exception as e:
+                logging.exception(f"Outbox retry failed: {e}")
+            next_retry = now + OUTBOX_RETRY_INTERVAL
+        time.sleep(max(0, min(poll_interval, (next_run - datetime.datetime.now()).total_seconds())))
 
 def main():
+    parser = argparse.ArgumentParser(description="Send tomorrow's reminders to the Make webhook")
+    parser.add_argument('--daemon', action='store_true', help="stay running and send reminders on a schedule")
+    parser.add_argument('--at', action='append', dest='times',
+                        help="daily run time as HH:MM, can be repeated (default: $REMINDER_TIMES or 20:00)")
+    parser.add_argument('--poll', type=float, default=30, help="seconds between reminders.csv change checks in daemon mode")
+    parser.add_argument('--profiles', help="JSON config of several classes/groups to send reminders for in one run")
+    args = parser.parse_args()
+
     logging.info("Starting reminders script...")
     csv_file_path = "reminders.csv"
-    check_events(csv_file_path)
+    if args.profiles:
+        check_profiles(args.profiles)
+    elif args.daemon:
+        times = args.times or os.getenv('REMINDER_TIMES', '20:00').split(',')
+        run_daemon(csv_file_path, [run_at.strip() for run_at in times], args.poll)
+    else:
+        check_events(csv_file_path)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,54 @@
+import datetime
+import json
+from payload_template import compile_template
+
+# Class timetable, exam dates and (optionally) the payload template, loaded from a JSON
+# data file instead of being hard-coded:
+#   {"timetable": {"0": ["subject", ...], ..., "6": [...]},   weekday number (0 = Monday)
+#    "exams": [{"name": "...", "date": "YYYY-MM-DD"}, ...],
+#    "payload": {...}}                                         see payload_template.py
+# Everything is formatted and compiled once at load time.
+
+SCHEDULE_PATH = 'schedule.json'
+
+# Format a day's subjects the way the payload shows them, one indented line per class.
+# Already formatted strings (older profile configs) are kept as they are.
+def format_subjects(subjects):
+    if isinstance(subjects, str):
+        return subjects
+    return " \n".join(f"   {subject}" for subject in subjects)
+
+# JSON object keys are strings, the timetable is looked up by weekday number
+def load_timetable(timetable):
+    return {int(day): format_subjects(subjects) for day, subjects in timetable.items()}
+
+def load_schedule(file_path=SCHEDULE_PATH):
+    with open(file_path, 'r', encoding='UTF-8') as file:
+        data = json.load(file)
+    exams = sorted(
+        (datetime.date.fromisoformat(exam['date']), exam['name']) for exam in data.get('exams', []))
+    return {
+        'timetable': load_timetable(data['timetable']),
+        'exams': exams,
+        'template': compile_template(data.get('payload')),
+    }
+
+# Countdown to one exam. `today` is the run's datetime; days count to midnight at the
+# start of the exam day, as the payload always has.
+def exam_countdown(exam_date, name, today):
+    days = (datetime.datetime.combine(exam_date, datetime.time()) - today).days
+    return {'name': name, 'date': exam_date, 'days': days, 'weeks': days // 7}
+
+# Countdowns to the exams that have not happened yet, nearest first
+def exam_countdowns(exams, today):
+    return [exam_countdown(exam_date, name, today) for exam_date, name in exams if exam_date >= today.date()]
+
+# Countdown behind the payload's days_til_test and weeks_til_test, which the Make scenario
+# reads as integers: the nearest upcoming exam or, once every exam has passed, the latest
+# one (negative days, as the hard-coded countdown used to send). Zero without any exams.
+def payload_countdown(exams, countdowns, today):
+    if countdowns:
+        return countdowns[0]
+    if exams:
+        return exam_countdown(*exams[-1], today)
+    return {'name': None, 'date': None, 'days': 0, 'weeks': 0}
@@ -1,16 +1,20 @@
 from dotenv import load_dotenv
+import argparse
 import os
-import csv
 import time
 import psutil
 import logging
 import datetime
 import json
-from google.auth.transport.requests import Request
+import re
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from event_cache import cache_path_for
+from metrics_store import append_metrics
+from sheet_sync import append_changes, diff_size, sync_sheet
+from supervisor import RunLocked, Supervisor, deadlines_from_env
+from timing import Timer
+from webhook import deliver
 
 #Configure logging
 logging.basicConfig(
@@ -28,102 +32,201 @@ load_dotenv()
 SPREADSHEET_ID = os.getenv("SPREADSHEET_ID")
 RANGE_NAME = "Sheet1!A4:E"
 
-def main():
-    start_time = time.time()
-    logging.info("Starting the script")
-    process = psutil.Process(os.getpid())
-    logging.debug(f"Process Info: {process}")
-    mem_before = process.memory_info().rss / 1024 / 1024  # in MB
-    logging.debug(f"Memory used before: {mem_before:.2f} MB")
+# Remembers the digest of the last synced sheet so unchanged sheets are not rewritten
+SYNC_STATE_PATH = "sync_state.json"
+METRICS_FILE_PATH = "downloader_metrics.jsonl"
+# Row-level diffs between syncs, one JSON line per sync that changed something
+CHANGES_FILE_PATH = "sync_changes.jsonl"
+# When set, each diff is also posted there as a compact "changes" payload
+CHANGES_WEBHOOK_URL = os.getenv("CHANGES_WEBHOOK_URL")
+
+# Refresh the access token ahead of time when it expires within this margin, so it
+# never expires halfway through a run
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+# Trimmed copy of the Sheets v4 discovery document (only the methods we call)
+DISCOVERY_CACHE_PATH = "sheets_v4_discovery.json"
+DISCOVERY_METHODS = ["get", "batchGet"]
+HTTP_TIMEOUT = 60
+
+# Keeps cron runs from overlapping (see supervisor.py)
+LOCK_FILE_PATH = "downloader.lock"
+# Per-stage deadlines in seconds; auth allows for the interactive OAuth flow on first use
+STAGE_DEADLINES = {"auth": 600, "build": 60, "write": 600, "notify": 300}
 
+# Authorized keep-alive HTTP transport shared by token refreshes and all Sheets requests
+_http = None
+
+def get_http(creds):
+    global _http
+    if _http is None or _http.credentials is not creds:
+        import httplib2
+        import google_auth_httplib2
+        _http = google_auth_httplib2.AuthorizedHttp(creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return _http
+
+# Load credentials from token.json, refreshing them only when they are close to expiry
+def load_credentials():
     creds = None
     # The file token.json stores the user's access and refresh tokens, and is
     # created automatically when the authorization flow completes for the first time.
     if os.path.exists("token.json"):
         logging.info("Loading credentials from token.json")
         creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+    if creds and creds.refresh_token:
+        # creds.expiry is a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        if not creds.valid or (creds.expiry is not None and creds.expiry - now < TOKEN_REFRESH_MARGIN):
+            logging.info("Token expired or about to expire, refreshing credentials.")
+            import google_auth_httplib2
+            creds.refresh(google_auth_httplib2.Request(get_http(creds).http))
+            save_credentials(creds)
     # If there are no (valid) credentials available, let the user log in.
     if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            logging.info("Token expired, refreshing credentials.")
-            creds.refresh(Request())
-        else:
-            logging.info("No valid credentials found, starting OAuth flow.")
-            flow = InstalledAppFlow.from_client_secrets_file(
-                "credentials.json", SCOPES
-            )
-            creds = flow.run_local_server(port=0)
-        # Save the credentials for the next run
-        with open("token.json", "w") as token:
-            logging.info("Saving credentials to token.json")
-            token.write(creds.to_json())
+        logging.info("No valid credentials found, starting OAuth flow.")
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        flow = InstalledAppFlow.from_client_secrets_file(
+            "credentials.json", SCOPES
+        )
+        creds = flow.run_local_server(port=0)
+        save_credentials(creds)
+    return creds
+
+# Save the credentials for the next run
+def save_credentials(creds):
+    with open("token.json", "w") as token:
+        logging.info("Saving credentials to token.json")
+        token.write(creds.to_json())
+
+# Keep only the spreadsheets.values methods we call and the schemas they reference
+def trim_discovery(document):
+    values = document["resources"]["spreadsheets"]["resources"]["values"]
+    methods = {name: values["methods"][name] for name in DISCOVERY_METHODS}
+    pending = [method["response"]["$ref"] for method in methods.values() if "response" in method]
+    schemas = {}
+    while pending:
+        name = pending.pop()
+        if name in schemas:
+            continue
+        schemas[name] = document["schemas"][name]
+        pending.extend(re.findall(r'"\$ref": "(\w+)"', json.dumps(schemas[name])))
+    trimmed = dict(document)
+    trimmed["resources"] = {"spreadsheets": {"resources": {"values": {"methods": methods}}}}
+    trimmed["schemas"] = schemas
+    return trimmed
+
+# Build the Sheets service from the locally cached discovery document over the shared
+# keep-alive transport, creating the cache from the library's bundled copy the first time
+def build_service(creds):
+    from googleapiclient.discovery import build_from_document
+    http = get_http(creds)
+    if os.path.exists(DISCOVERY_CACHE_PATH):
+        with open(DISCOVERY_CACHE_PATH, "r", encoding="UTF-8") as file:
+            return build_from_document(file.read(), http=http)
+    from googleapiclient.discovery_cache import get_static_doc
+    content = get_static_doc("sheets", "v4")
+    if content is None:
+        raise RuntimeError("google-api-python-client has no bundled Sheets v4 discovery document (needs 2.0 or later)")
+    logging.info(f"Caching the Sheets discovery document in {DISCOVERY_CACHE_PATH}")
+    document = trim_discovery(json.loads(content))
+    with open(DISCOVERY_CACHE_PATH, "w", encoding="UTF-8") as file:
+        json.dump(document, file)
+    return build_from_document(document, http=http)
+
+# Push only the delta downstream; queued in its own outbox if the webhook is down
+def notify_changes(changes):
+    payload = {"type": "changes", **{f"{kind}_count": len(items) for kind, items in changes.items()}, **changes}
+    delivery = deliver(CHANGES_WEBHOOK_URL, payload, outbox_path="webhook_outbox_changes.jsonl")
+    logging.info(f"Changes webhook delivered: {delivery['webhook_ok']}")
+    return delivery
+
+# Metrics record for a run that did not complete: skipped because another run held the
+# lock, failed on a Sheets API error, or timed out / aborted by the supervisor
+def record_failed_run(record):
+    append_metrics(METRICS_FILE_PATH, {"timestamp": datetime.datetime.now().isoformat(), **record})
 
+def main():
+    parser = argparse.ArgumentParser(description="Download reminders from Google Sheets into reminders.csv")
+    parser.add_argument("--full", action="store_true", help="rewrite reminders.csv even if the sheet is unchanged")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    logging.info("Starting the script")
+    process = psutil.Process(os.getpid())
+    logging.debug(f"Process Info: {process}")
+    mem_before = process.memory_info().rss / 1024 / 1024  # in MB
+    logging.debug(f"Memory used before: {mem_before:.2f} MB")
+
+    # Stages: auth, build, fetch (waiting on the API), write (streaming reminders.csv), cache, notify
+    timer = Timer()
     try:
-        service = build("sheets", "v4", credentials=creds)
-
-        # Call the Sheets API
-        logging.info("Requesting data from Google Sheets...")
-        request_time = time.time()
-        sheet = service.spreadsheets()
-        result = (
-            sheet.values()
-            .get(spreadsheetId=SPREADSHEET_ID, range=RANGE_NAME)
-            .execute()
-        )
-        received_time = time.time()
-        logging.info(f"Request completed in {received_time - request_time:.4f} seconds...")
-        values = result.get("values", [])
-        logging.info(f"Received {len(values)} rows of data.")
-
-        if not values:
-            logging.warning("No data found.")
-            return
-        try:
-            logging.info("Writing data to reminders.csv...")
-            with open("reminders.csv", mode="w", encoding="UTF-8", newline="") as file:
-                writer = csv.writer(file)
-                logging.debug("Writing headers to CSV file...")
-                writer.writerow(["Event name", "Event date and time", "Weekday"])
-                i=1
-                for row in values:
-                    if len(row) >= 5:
-                        logging.debug(f"Writing row {i} to CSV file...")
-                        writer.writerow([row[0], row[3], row[4]])
-                        i+=1
-        except Exception as e:
-            print(e)
-    except HttpError as err:
-        print(err)
-
-    logging.info("reminders.csv has been created successfully.")
+        with Supervisor(LOCK_FILE_PATH, deadlines_from_env(STAGE_DEADLINES), timer=timer,
+                        on_abort=record_failed_run) as supervisor:
+            with supervisor.stage("auth"):
+                creds = load_credentials()
+
+            try:
+                with supervisor.stage("build"):
+                    service = build_service(creds)
+
+                # Call the Sheets API
+                logging.info("Requesting data from Google Sheets...")
+                # The write stage also builds the pre-parsed event cache, so reminders.py and the
+                # dashboard can skip CSV parsing
+                with supervisor.stage("write"):
+                    sync = sync_sheet(service, SPREADSHEET_ID, RANGE_NAME, "reminders.csv", SYNC_STATE_PATH,
+                                      full=args.full, timer=timer, cache_path=cache_path_for("reminders.csv"))
+                # Only the time spent waiting on the API, as charted by the dashboard: the write
+                # stage also covers streaming, hashing, diffing and the event cache
+                request_time = timer.durations.get("fetch", 0.0)
+                logging.info(f"Request completed in {request_time:.4f} seconds...")
+
+                if not sync["rows"]:
+                    logging.warning("No data found.")
+                    return
+
+                changes = sync["changes"]
+                if changes and diff_size(changes):
+                    append_changes(CHANGES_FILE_PATH, changes, datetime.datetime.now().isoformat())
+                    if CHANGES_WEBHOOK_URL:
+                        with supervisor.stage("notify"):
+                            notify_changes(changes)
+
+                if sync["cache_written"]:
+                    logging.info(f"Event cache written to {cache_path_for('reminders.csv')}")
+            except HttpError as err:
+                logging.error(f"Sheets request failed: {err}")
+                record_failed_run({"status": "failed", "abort_reason": str(err), **timer.metrics()})
+                return
+    except RunLocked as e:
+        logging.warning(f"Skipping this run: {e}")
+        record_failed_run({"status": "skipped", "abort_reason": str(e)})
+        return
+    finally:
+        timer.stop()
+
+    if sync["written"]:
+        logging.info(f"reminders.csv has been updated successfully ({sync['mode']}, {sync['rows_changed']} rows changed).")
     mem_after = process.memory_info().rss / 1024 / 1024  # in MB
     logging.debug(f"Memory used after: {mem_after:.2f} MB")
     end_time = time.time()
-    logging.info(f"Script completed in {end_time - start_time:.4f} seconds.")
+    logging.info(f"Script completed in {end_time - start_time:.4f} seconds ({timer.describe()}).")
 
     # Save metrics
     metrics = {
         'timestamp': datetime.datetime.now().isoformat(),
+        'status': 'ok',
         'execution_time': end_time - start_time,
-        'request_time': received_time - request_time,
+        'request_time': request_time,
         'memory_before': mem_before,
         'memory_after': mem_after,
         'memory_delta': mem_after - mem_before,
-        'csv_file_size': os.path.getsize('reminders.csv') / 1024  # in KB
+        'csv_file_size': os.path.getsize('reminders.csv') / 1024,  # in KB
+        'rows_changed': sync['rows_changed'],
+        **({f"events_{kind}_count": len(items) for kind, items in sync['changes'].items()} if sync['changes'] else {}),
+        'csv_written': sync['written'],
+        **timer.metrics()
     }
-    metrics_file_path = 'downloader_metrics.json'
-    if os.path.exists(metrics_file_path):
-        with open(metrics_file_path, 'r') as metrics_file:
-            all_metrics = json.load(metrics_file)
-            if not isinstance(all_metrics, list):
-                all_metrics = [all_metrics]
-    else:
-        all_metrics = []
-
-    all_metrics.append(metrics)
-
-    with open(metrics_file_path, 'w') as metrics_file:
-        json.dump(all_metrics, metrics_file, indent=4)
+    append_metrics(METRICS_FILE_PATH, metrics)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
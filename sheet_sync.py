@@ -0,0 +1,237 @@
+import csv
+import hashlib
+import json
+import logging
+import os
+import re
+from event_cache import CacheWriter, is_cache_fresh
+from events import parse_event_datetime
+from timing import Timer
+
+CSV_HEADER = ["Event name", "Event date and time", "Weekday"]
+
+# Hash a CSV row for the digest of the whole sheet
+def row_hash(row):
+    return hashlib.sha1("\x1f".join(row).encode("UTF-8")).hexdigest()
+
+# Stable identity of an event across syncs: a short hash of its name and date, plus the
+# occurrence number when the sheet lists the same name and date more than once
+def event_key(row, seen):
+    digest = hashlib.blake2b(f"{row[0]}\x1f{row[1]}".encode("UTF-8"), digest_size=8).hexdigest()
+    seen[digest] = seen.get(digest, 0) + 1
+    return digest if seen[digest] == 1 else f"{digest}:{seen[digest]}"
+
+def event_fields(row):
+    return {"name": row[0], "date": row[1], "weekday": row[2]}
+
+# Short hash of a whole row, to tell a changed event from an unchanged one
+def row_digest(row):
+    return hashlib.blake2b("\x1f".join(row).encode("UTF-8"), digest_size=8).digest()
+
+# Rows of a CSV written by sync_sheet, without the header
+def read_csv_rows(file_path):
+    with open(file_path, mode="r", encoding="UTF-8", newline="") as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        for row in reader:
+            if row:
+                yield row
+
+# Row-level diff of the CSV from the previous sync against the new one, in O(N) with a
+# hash map. Both files are streamed: only a key and a row digest per old event are held,
+# plus the rows that differ.
+#   added / removed   events only in the new / old CSV
+#   moved             an event whose key disappeared while one with the same name appeared
+#   changed           same name and date, different row (the weekday column)
+def diff_csv(old_path, new_path):
+    old = {}
+    seen = {}
+    for row in read_csv_rows(old_path):
+        old[event_key(row, seen)] = row_digest(row)
+    added = []
+    changed = []
+    seen = {}
+    for row in read_csv_rows(new_path):
+        digest = old.pop(event_key(row, seen), None)
+        if digest is None:
+            added.append(row)
+        elif digest != row_digest(row):
+            changed.append(event_fields(row))
+    # What is left of the old keys was removed; one more pass picks up those rows
+    removed_by_name = {}
+    if old:
+        seen = {}
+        for row in read_csv_rows(old_path):
+            if event_key(row, seen) in old:
+                removed_by_name.setdefault(row[0], []).append(row)
+
+    moved = []
+    still_added = []
+    for row in added:
+        candidates = removed_by_name.get(row[0])
+        if candidates:
+            old_row = candidates.pop(0)
+            moved.append({"name": row[0], "from": old_row[1], "to": row[1], "weekday": row[2]})
+        else:
+            still_added.append(event_fields(row))
+    still_removed = [event_fields(row) for rows in removed_by_name.values() for row in rows]
+    return {"added": still_added, "removed": still_removed, "moved": moved, "changed": changed}
+
+def diff_size(changes):
+    return sum(len(changes[kind]) for kind in ("added", "removed", "moved", "changed"))
+
+# Append a non-empty diff to the JSON Lines change log
+def append_changes(file_path, changes, timestamp):
+    with open(file_path, "a", encoding="UTF-8") as file:
+        file.write(json.dumps({"timestamp": timestamp, **changes}, ensure_ascii=False) + "\n")
+
+# Load the state remembered from the previous sync (empty on first run)
+def load_sync_state(file_path):
+    if os.path.exists(file_path):
+        with open(file_path, "r", encoding="UTF-8") as file:
+            return json.load(file)
+    return {}
+
+# Write the sync state to a temp file and swap it in so a crash never leaves it half-written
+def save_sync_state(file_path, state):
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w", encoding="UTF-8") as file:
+        json.dump(state, file)
+    os.replace(temp_path, file_path)
+
+# Split an open-ended A1 range like "Sheet1!A4:E" into (sheet, first column, first row, last column)
+def parse_range(range_name):
+    match = re.fullmatch(r"(.+)!([A-Z]+)(\d+):([A-Z]+)", range_name)
+    if not match:
+        raise ValueError(f"Expected a range like 'Sheet1!A4:E', got {range_name!r}")
+    sheet, first_column, first_row, last_column = match.groups()
+    return sheet, first_column, int(first_row), last_column
+
+# Number of rows in the sheet's grid: the range values().get() reports for a whole column
+# covers the grid even when trailing rows are blank, and fields="range" leaves the values out
+def grid_row_count(service, spreadsheet_id, sheet, column):
+    result = (
+        service.spreadsheets()
+        .values()
+        .get(spreadsheetId=spreadsheet_id, range=f"{sheet}!{column}:{column}", fields="range")
+        .execute()
+    )
+    return int(re.search(r"(\d+)$", result["range"]).group(1))
+
+# Yield the sheet's rows page by page using values().batchGet over consecutive row ranges,
+# so only one request's worth of rows is held in memory at a time. Pages stop at the last
+# row of the grid, so blank rows anywhere in the sheet (they come back as [] or as a page
+# without values) never end the fetch early. Time spent waiting for the API is recorded
+# in the timer's "fetch" span.
+def fetch_rows(service, spreadsheet_id, range_name, page_rows=1000, pages_per_request=5, timer=None):
+    timer = timer or Timer(trace_memory=False)
+    sheet, first_column, row, last_column = parse_range(range_name)
+    with timer.span("fetch"):
+        last_row = grid_row_count(service, spreadsheet_id, sheet, first_column)
+    while row <= last_row:
+        ranges = []
+        while row <= last_row and len(ranges) < pages_per_request:
+            ranges.append(f"{sheet}!{first_column}{row}:{last_column}{min(row + page_rows - 1, last_row)}")
+            row += page_rows
+        with timer.span("fetch"):
+            result = (
+                service.spreadsheets()
+                .values()
+                .batchGet(spreadsheetId=spreadsheet_id, ranges=ranges)
+                .execute()
+            )
+        value_ranges = result.get("valueRanges", [])
+        for value_range in value_ranges:
+            yield from value_range.get("values", [])
+        if len(value_ranges) < len(ranges):
+            return
+
+# Keep the columns written to reminders.csv, skipping rows with fewer than 5 columns
+def select_row(row):
+    if len(row) >= 5:
+        return [row[0], row[3], row[4]]
+    return None
+
+# Add a CSV row to the event cache; a date the cache cannot parse drops the cache for this
+# sync (returns None), and the consumers parse reminders.csv instead
+def add_to_cache(cache, row):
+    try:
+        cache.add(row[0].strip(), parse_event_datetime(row[1].strip()), row[2].strip())
+    except ValueError as e:
+        logging.warning(f"Not writing the event cache, {row[1]!r} is not a valid date: {e}")
+        cache.discard()
+        return None
+    return cache
+
+# Stream the sheet into a temp file next to csv_path and atomically replace csv_path
+# with it, unless the content is the same as at the last sync (`full` rewrites anyway).
+# Readers never see a partially written reminders.csv. With `cache_path`, the pre-parsed
+# event cache (see event_cache.py) is built from the same rows as they stream and written
+# whenever the CSV is, or when the existing cache is stale. A changed sheet is diffed
+# against the CSV it replaces, so the state only keeps the sheet's digest. Returns a
+# summary dict for the downloader's metrics; its "changes" (see diff_csv) is None
+# when the sheet is unchanged or there is no previous CSV to compare with.
+def sync_sheet(service, spreadsheet_id, range_name, csv_path, state_path, full=False,
+               page_rows=1000, pages_per_request=5, timer=None, cache_path=None):
+    timer = timer or Timer(trace_memory=False)
+    state = load_sync_state(state_path)
+    cache = CacheWriter(csv_path, cache_path) if cache_path else None
+    rows = 0
+    digest = hashlib.sha1()
+
+    temp_path = f"{csv_path}.tmp"
+    try:
+        with open(temp_path, mode="w", encoding="UTF-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(CSV_HEADER)
+            for values in fetch_rows(service, spreadsheet_id, range_name, page_rows, pages_per_request, timer):
+                row = select_row(values)
+                if row is None:
+                    continue
+                writer.writerow(row)
+                digest.update(row_hash(row).encode("ascii"))
+                rows += 1
+                if cache:
+                    cache = add_to_cache(cache, row)
+        digest = digest.hexdigest()
+        logging.info(f"Received {rows} rows of data.")
+
+        summary = {"rows": rows, "rows_changed": 0, "changes": None, "written": False, "mode": "skip",
+                   "cache_written": False}
+        if not rows:
+            return summary
+        unchanged = state.get("digest") == digest and os.path.exists(csv_path)
+        if unchanged and not full:
+            logging.info("Sheet unchanged since last sync, skipping write.")
+            if cache and not is_cache_fresh(csv_path, cache.cache_path):
+                # Same content as the CSV on disk, so the cache built from the rows matches it
+                with timer.span("cache"):
+                    cache.finish()
+                summary["cache_written"] = True
+            return summary
+        if os.path.exists(csv_path):
+            if not unchanged:
+                changes = diff_csv(csv_path, temp_path)
+                summary["changes"] = changes
+                summary["rows_changed"] = diff_size(changes)
+                logging.info("Sheet changed: " + ", ".join(f"{len(changes[kind])} {kind}" for kind in changes))
+        else:
+            # No CSV from an earlier sync: every row counts as changed
+            summary["rows_changed"] = rows
+
+        logging.info(f"Replacing {csv_path} with {rows} rows...")
+        os.replace(temp_path, csv_path)
+        if cache:
+            with timer.span("cache"):
+                cache.finish()
+            summary["cache_written"] = True
+    finally:
+        if cache:
+            cache.discard()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    summary["written"] = True
+    summary["mode"] = "full"
+    save_sync_state(state_path, {"digest": digest, "row_count": rows})
+    return summary
@@ -0,0 +1,195 @@
+import contextlib
+import datetime
+import fcntl
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from timing import Timer
+
+# Run supervisor for the cron scripts and the reminders daemon:
+#   - a lock file so a run never overlaps the previous one (RunLocked is raised instead)
+#   - a wall-clock deadline per stage and a memory ceiling (RSS), checked by a watchdog
+#     thread; a run that breaks either is recorded through on_abort with status
+#     "timed_out" or "aborted". A one-shot run then exits with EXIT_ABORTED, because a
+#     call hung inside a socket cannot be interrupted from another thread. A long-running
+#     process (exit_on_abort=False) has the main thread signalled instead: the signal
+#     interrupts the blocking call, RunAborted is raised in its place and the process
+#     carries on with its next run.
+# Stages are timer spans too, so they show up in the stage breakdown.
+#
+# STAGE_DEADLINES="webhook=60,write=300" overrides the scripts' deadlines (seconds, 0 = none)
+# and MEMORY_LIMIT_MB the memory ceiling (0 = none). RSS is read from /proc, so psutil is
+# not needed; where /proc is missing the ceiling is not checked.
+
+MEMORY_LIMIT_MB = float(os.getenv('MEMORY_LIMIT_MB', '512'))
+EXIT_ABORTED = 3
+# Sent to the main thread to abort a run in a process that keeps running
+ABORT_SIGNAL = signal.SIGUSR1
+
+class RunLocked(Exception):
+    pass
+
+# Raised in the main thread when the watchdog aborts a run with exit_on_abort=False
+class RunAborted(Exception):
+    def __init__(self, record):
+        super().__init__(f"Run {record['status']} in stage {record['abort_stage']}: {record['abort_reason']}")
+        self.record = record
+
+# {stage: seconds} from "stage=seconds,..."
+def parse_deadlines(text):
+    deadlines = {}
+    for item in filter(None, (part.strip() for part in text.split(','))):
+        stage, seconds = item.split('=')
+        deadlines[stage.strip()] = float(seconds)
+    return deadlines
+
+# A script's default deadlines with the STAGE_DEADLINES overrides applied
+def deadlines_from_env(defaults):
+    return {**defaults, **parse_deadlines(os.getenv('STAGE_DEADLINES', ''))}
+
+# Resident memory of this process in MB, or None where /proc is not available
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            resident_pages = int(file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+# Lock file held with flock(). The kernel releases the lock when its process ends however
+# it ends (killed, crashed, machine rebooted), so a lock is never left behind; the file
+# itself stays and only records the last owner's PID for whoever looks at it.
+class RunLock:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self._fd = None
+
+    def acquire(self):
+        fd = os.open(self.file_path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, json.dumps({'pid': os.getpid(), 'started': datetime.datetime.now().isoformat()}).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+class Supervisor:
+    def __init__(self, lock_path, deadlines=None, memory_limit_mb=None, timer=None, on_abort=None,
+                 poll_interval=0.5, exit_on_abort=True):
+        self.lock = RunLock(lock_path)
+        self.deadlines = deadlines or {}
+        self.memory_limit_mb = MEMORY_LIMIT_MB if memory_limit_mb is None else memory_limit_mb
+        self.timer = timer or Timer()
+        self.on_abort = on_abort
+        self.poll_interval = poll_interval
+        self.exit_on_abort = exit_on_abort
+        # Running stages as (name, deadline on the perf_counter clock or None)
+        self._stages = []
+        self._stopped = threading.Event()
+        self._watchdog = None
+        self._abort_record = None
+        self._previous_handler = None
+        # True while a stage runs: RunAborted is only raised there, never while the
+        # supervisor itself is cleaning up
+        self._in_stage = False
+        self.start_time = None
+
+    def __enter__(self):
+        if not self.lock.acquire():
+            raise RunLocked(f"Another run holds {self.lock.file_path}")
+        self.start_time = time.perf_counter()
+        if not self.exit_on_abort:
+            # Signal handlers run in the main thread, which must be the one entering
+            self._previous_handler = signal.signal(ABORT_SIGNAL, self._raise_abort)
+        self._watchdog = threading.Thread(target=self._watch, name='supervisor', daemon=True)
+        self._watchdog.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stopped.set()
+        self._watchdog.join()
+        if not self.exit_on_abort:
+            signal.signal(ABORT_SIGNAL, self._previous_handler)
+            if self._abort_record is not None and exc_type is not RunAborted:
+                logging.info("The run finished outside a stage before it could be aborted")
+        if exc_type is RunAborted:
+            self._record(exc_value.record)
+        self.lock.release()
+        return False
+
+    # Run a stage under its deadline (if it has one) and time it as a span
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self._abort_record is not None:
+            # Aborted while between stages
+            raise RunAborted(self._abort_record)
+        seconds = self.deadlines.get(name)
+        self._stages.append((name, time.perf_counter() + seconds if seconds else None))
+        outer = self._in_stage
+        try:
+            with self.timer.span(name):
+                self._in_stage = True
+                yield
+        finally:
+            self._in_stage = outer
+            self._stages.pop()
+
+    def _watch(self):
+        if self.memory_limit_mb and current_rss_mb() is None:
+            logging.warning("No /proc/self/statm, the memory ceiling is not checked")
+        while not self._stopped.wait(self.poll_interval):
+            now = time.perf_counter()
+            for name, deadline in list(self._stages):
+                if deadline is not None and now > deadline:
+                    self._abort('timed_out', name, f"exceeded its {self.deadlines[name]:g} s deadline")
+                    return
+            rss = current_rss_mb() if self.memory_limit_mb else None
+            if rss is not None and rss > self.memory_limit_mb:
+                stage = self._stages[-1][0] if self._stages else None
+                self._abort('aborted', stage, f"memory {rss:.0f} MB over the {self.memory_limit_mb:g} MB ceiling")
+                return
+
+    def _abort(self, status, stage, reason):
+        logging.error(f"Run {status} in stage {stage}: {reason}")
+        record = {
+            'status': status,
+            'abort_stage': stage,
+            'abort_reason': reason,
+            'execution_time': time.perf_counter() - self.start_time,
+            **self.timer.metrics(),
+        }
+        if not self.exit_on_abort:
+            # __exit__ records the run once RunAborted has unwound the stage
+            self._abort_record = record
+            signal.pthread_kill(threading.main_thread().ident, ABORT_SIGNAL)
+            return
+        # Record the abort, free the lock and end the process
+        try:
+            self._record(record)
+        finally:
+            self.lock.release()
+            logging.shutdown()
+            os._exit(EXIT_ABORTED)
+
+    def _raise_abort(self, signum, frame):
+        if self._abort_record is not None and self._in_stage:
+            raise RunAborted(self._abort_record)
+
+    def _record(self, record):
+        try:
+            if self.on_abort:
+                self.on_abort(record)
+        except Exception as e:
+            logging.exception(f"Failed to record the aborted run: {e}")
@@ -0,0 +1,68 @@
+import collections
+import datetime
+import logging
+import threading
+import psutil
+
+# Background sampler for the dashboard's system metrics. A daemon thread takes a
+# snapshot every `interval` seconds into a bounded ring buffer, so page renders only
+# read the latest sample instead of blocking on psutil.cpu_percent(interval=1).
+class SystemSampler:
+    def __init__(self, interval=2.0, history=300):
+        self.interval = interval
+        self.samples = collections.deque(maxlen=history)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    # Take one snapshot of CPU, memory, disk, network and processes
+    def take_sample(self, cpu_interval=None):
+        network_info = psutil.net_io_counters()
+        processes = [process.info for process in psutil.process_iter(['pid', 'name', 'username'])]
+        return {
+            'timestamp': datetime.datetime.now(),
+            # interval=None compares against the previous call, so it never blocks
+            'cpu_usage': psutil.cpu_percent(interval=cpu_interval),
+            'cpu_count': psutil.cpu_count(),
+            'cpu_freq': psutil.cpu_freq(),
+            'memory_info': psutil.virtual_memory(),
+            'memory_swap': psutil.swap_memory(),
+            'disk_usage': psutil.disk_usage('/'),
+            'net_info': psutil.net_if_stats(),
+            'network_sent': network_info.bytes_sent,
+            'network_recv': network_info.bytes_recv,
+            'processes': processes,
+        }
+
+    def start(self):
+        if self.thread is not None:
+            return
+        # The first sample has no previous cpu_percent call to compare against,
+        # so measure it over a short blocking window once per server process
+        self.record(self.take_sample(cpu_interval=0.1))
+        self.thread = threading.Thread(target=self.run, name="system-sampler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.record(self.take_sample())
+            except Exception as e:
+                logging.error(f"System sampler failed: {e}")
+
+    def record(self, sample):
+        with self.lock:
+            self.samples.append(sample)
+
+    # Most recent snapshot (None before the first sample)
+    def latest(self):
+        with self.lock:
+            return self.samples[-1] if self.samples else None
+
+    # Copy of the buffered snapshots, oldest first
+    def history(self):
+        with self.lock:
+            return list(self.samples)
@@ -0,0 +1,78 @@
+import datetime
+from log_reader import read_page
+
+START = datetime.datetime(2025, 1, 17, 20, 0)
+
+TRACEBACK = [
+    "Traceback (most recent call last):",
+    '  File "reminders.py", line 250, in run_daemon',
+    "ValueError: bad row",
+]
+
+# Records one minute apart; every 7th is an ERROR followed by a traceback
+def write_log(file_path, records):
+    lines = []
+    for i in range(records):
+        timestamp = (START + datetime.timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S")
+        level = "ERROR" if i % 7 == 6 else ("DEBUG" if i % 2 else "INFO")
+        lines.append(f"{timestamp},123 - {level} - record {i}")
+        if level == "ERROR":
+            lines.extend(TRACEBACK)
+    with open(file_path, "w", encoding="UTF-8") as file:
+        file.write("\n".join(lines) + "\n")
+    return lines
+
+# Read every page from the end, returning them oldest page first
+def read_all(file_path, count, **filters):
+    pages = []
+    offset = None
+    while True:
+        lines, offset = read_page(file_path, count, offset, **filters)
+        pages.insert(0, lines)
+        if offset == 0:
+            return pages
+
+def test_pages_cover_the_file_without_gaps_or_overlaps(tmp_path):
+    file_path = str(tmp_path / "reminders.log")
+    lines = write_log(file_path, 100)
+    pages = read_all(file_path, 25)
+    assert all(len(page) == 25 for page in pages[1:])
+    assert [line for page in pages for line in page] == lines
+
+def test_tracebacks_stay_with_their_record(tmp_path):
+    file_path = str(tmp_path / "reminders.log")
+    write_log(file_path, 100)
+    lines = [line for page in read_all(file_path, 10, min_level="INFO") for line in page]
+    assert not any("DEBUG" in line for line in lines)
+    errors = [i for i, line in enumerate(lines) if " - ERROR - " in line]
+    assert len(errors) == 14
+    for i in errors:
+        assert lines[i + 1:i + 4] == TRACEBACK
+    # Only the ERROR records have tracebacks under them
+    assert lines.count(TRACEBACK[0]) == len(errors)
+
+def test_a_filtered_page_does_not_split_a_traceback(tmp_path):
+    file_path = str(tmp_path / "reminders.log")
+    write_log(file_path, 100)
+    # Each ERROR record comes with three lines, so every page runs over to hold one whole
+    pages = [page for page in read_all(file_path, 2, min_level="ERROR") if page]
+    assert len(pages) == 14
+    for page in pages:
+        assert " - ERROR - " in page[0] and page[1:] == TRACEBACK
+
+def test_time_range_stops_at_its_start(tmp_path):
+    file_path = str(tmp_path / "reminders.log")
+    write_log(file_path, 100)
+    start = START + datetime.timedelta(minutes=40)
+    end = START + datetime.timedelta(minutes=59)
+    pages = read_all(file_path, 8, start=start, end=end)
+    lines = [line for page in pages for line in page]
+    records = [line for line in lines if " - " in line]
+    assert records[0].endswith("record 40") and records[-1].endswith("record 59")
+    assert len(records) == 20
+    assert lines.count(TRACEBACK[0]) == 3
+
+def test_missing_or_empty_file(tmp_path):
+    assert read_page(str(tmp_path / "missing.log")) == ([], 0)
+    (tmp_path / "empty.log").write_text("")
+    assert read_page(str(tmp_path / "empty.log")) == ([], 0)
@@ -0,0 +1,93 @@
+import datetime
+import os
+import random
+import statistics
+import metrics_rollup
+from metrics_rollup import closed_path_for, load_rollups, percentile, rollup_path_for
+from metrics_store import append_metrics, load_metrics
+
+START = datetime.datetime(2025, 1, 6)
+
+def write_runs(file_path, runs, hours=1.0):
+    rng = random.Random(7)
+    for i in range(runs):
+        append_metrics(file_path, {
+            'timestamp': (START + datetime.timedelta(hours=i * hours)).isoformat(),
+            'status': 'skipped' if i % 10 == 9 else 'ok',
+            'reminders_tomorrow_count': i % 5,
+            'execution_time': rng.lognormvariate(-2, 1),
+        })
+
+def test_daily_buckets_match_the_raw_records(tmp_path):
+    file_path = str(tmp_path / 'metrics.jsonl')
+    write_runs(file_path, 24 * 10)
+    records = load_metrics(file_path)
+    buckets = load_rollups(file_path, 'daily')
+    assert len(buckets) == 10
+    for bucket in buckets:
+        day = [record for record in records if record['timestamp'].startswith(bucket['timestamp'])]
+        times = [record['execution_time'] for record in day]
+        assert bucket['runs'] == len(day)
+        assert bucket['status_skipped_runs'] == sum(record['status'] == 'skipped' for record in day)
+        assert bucket['reminders_tomorrow_count'] == day[-1]['reminders_tomorrow_count']
+        assert abs(bucket['execution_time'] - statistics.mean(times)) < 1e-9
+        assert bucket['execution_time_min'] == min(times) and bucket['execution_time_max'] == max(times)
+        # p95 comes from the histogram, within half a bin of the exact value
+        assert abs(bucket['execution_time_p95'] / percentile(times, 0.95) - 1) < 0.05
+
+def test_state_stays_small_as_history_grows(tmp_path):
+    file_path = str(tmp_path / 'metrics.jsonl')
+    write_runs(file_path, 7 * 24)
+    week_size = os.path.getsize(rollup_path_for(file_path))
+    write_runs(file_path, 7 * 24 * 8, hours=1 / 8)
+    # Only the open buckets are rewritten on each run; closed ones are appended once
+    assert os.path.getsize(rollup_path_for(file_path)) < 2 * week_size
+    assert len(load_rollups(file_path, 'weekly')) == 1
+
+def test_rebuild_matches_incremental_updates(tmp_path):
+    file_path = str(tmp_path / 'metrics.jsonl')
+    write_runs(file_path, 24 * 20)
+    incremental = load_rollups(file_path, 'weekly')
+    os.remove(rollup_path_for(file_path))
+    os.remove(closed_path_for(file_path))
+    assert load_rollups(file_path, 'weekly') == incremental
+
+def test_uncommitted_closed_buckets_are_ignored(tmp_path):
+    file_path = str(tmp_path / 'metrics.jsonl')
+    write_runs(file_path, 24 * 3)
+    expected = load_rollups(file_path, 'daily')
+    # A run that stopped after appending to the .jsonl but before saving the .json
+    with open(closed_path_for(file_path), 'ab') as file:
+        file.write(b'{"resolution": "daily", "start": "2025-01-06", "profile": null, "runs": 5')
+    assert load_rollups(file_path, 'daily') == expected
+    # Runs from the same days again (out of order) go into buckets of their own, merged on load
+    write_runs(file_path, 24 * 4)
+    assert [bucket['runs'] for bucket in load_rollups(file_path, 'daily')] == [48, 48, 48, 24]
+
+def test_old_rollup_files_are_rebuilt(tmp_path):
+    file_path = str(tmp_path / 'metrics.jsonl')
+    write_runs(file_path, 48)
+    expected = load_rollups(file_path, 'daily')
+    with open(rollup_path_for(file_path), 'w', encoding='UTF-8') as file:
+        file.write('{"daily": {}, "weekly": {}}')
+    assert metrics_rollup.load_rollup_file(file_path) is None
+    assert load_rollups(file_path, 'daily') == expected
+
+def test_counts_keep_the_newest_value_when_records_arrive_out_of_order(tmp_path):
+    file_path = str(tmp_path / 'metrics.jsonl')
+    at = lambda day, hour: (START + datetime.timedelta(days=day, hours=hour)).isoformat()
+    append_metrics(file_path, {'timestamp': at(0, 20), 'total_reminders_count': 10})
+    append_metrics(file_path, {'timestamp': at(1, 20), 'total_reminders_count': 11})
+    # Older than the open day: a bucket of its own, appended after the first day's
+    append_metrics(file_path, {'timestamp': at(0, 8), 'total_reminders_count': 3, 'events_added_count': 1})
+    # Older than the last record of the open day
+    append_metrics(file_path, {'timestamp': at(1, 9), 'total_reminders_count': 4})
+    for _ in range(2):
+        days = load_rollups(file_path, 'daily')
+        assert [day['total_reminders_count'] for day in days] == [10, 11]
+        # A field only the older record has is still kept
+        assert days[0]['events_added_count'] == 1
+        [week] = load_rollups(file_path, 'weekly')
+        assert week['total_reminders_count'] == 11 and week['runs'] == 4
+        os.remove(rollup_path_for(file_path))
+        os.remove(closed_path_for(file_path))
@@ -0,0 +1,31 @@
+import datetime
+import json
+from metrics_store import load_metrics
+
+START = datetime.datetime(2025, 1, 6)
+
+def write_records(file_path, hours):
+    with open(file_path, 'w', encoding='UTF-8') as file:
+        for i, offset in enumerate(hours):
+            record = {'timestamp': (START + datetime.timedelta(hours=offset)).isoformat(), 'run': i}
+            file.write(json.dumps(record) + '\n')
+
+def test_window_keeps_records_appended_slightly_out_of_order(tmp_path):
+    file_path = str(tmp_path / 'metrics.jsonl')
+    # Run 3 was stamped before run 2 (e.g. a skipped run appended during a long one), and
+    # run 6 after the clock went back an hour
+    write_records(file_path, [0, 10, 20, 19.5, 30, 40, 39, 50])
+    runs = lambda start, end: [record['run'] for record in load_metrics(file_path, start, end)]
+    assert runs(START + datetime.timedelta(hours=19.5), None) == [2, 3, 4, 5, 6, 7]
+    assert runs(START + datetime.timedelta(hours=19.75), None) == [2, 4, 5, 6, 7]
+    assert runs(None, START + datetime.timedelta(hours=19.75)) == [0, 1, 3]
+    assert runs(START + datetime.timedelta(hours=39), START + datetime.timedelta(hours=39.5)) == [6]
+    assert runs(None, None) == list(range(8))
+
+def test_window_skips_a_partially_written_line(tmp_path):
+    file_path = str(tmp_path / 'metrics.jsonl')
+    write_records(file_path, range(100))
+    with open(file_path, 'a', encoding='UTF-8') as file:
+        file.write('{"timestamp": "2025-01')
+    records = load_metrics(file_path, START + datetime.timedelta(hours=50), START + datetime.timedelta(hours=200))
+    assert [record['run'] for record in records] == list(range(50, 100))
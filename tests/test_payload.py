@@ -0,0 +1,61 @@
+import datetime
+import json
+import reminders
+from events import Event, EventIndex
+from schedule import load_schedule
+
+# Keys and value types the Make scenario reads
+PAYLOAD_TYPES = {
+    'classes_tomorrow': str,
+    'reminders_tomorrow': str,
+    'reminders_week': str,
+    'reminders_monday': str,
+    'days_til_test': int,
+    'weeks_til_test': int,
+}
+
+def write_schedule(tmp_path, exams, payload=None):
+    data = {'timetable': {str(day): [f"class {day}"] for day in range(7)}, 'exams': exams}
+    if payload:
+        data['payload'] = payload
+    file_path = tmp_path / 'schedule.json'
+    file_path.write_text(json.dumps(data), encoding='UTF-8')
+    return load_schedule(str(file_path))
+
+def build(schedule, today):
+    index = EventIndex([Event('Essay', today + datetime.timedelta(days=1), 'Fri')])
+    return reminders.build_payload(index, today, schedule)[0]
+
+def check_contract(payload):
+    assert set(payload) == set(PAYLOAD_TYPES)
+    for key, value_type in PAYLOAD_TYPES.items():
+        assert type(payload[key]) is value_type, key
+
+def test_upcoming_exam(tmp_path):
+    schedule = write_schedule(tmp_path, [{'name': 'Finals', 'date': '2025-01-18'}])
+    payload = build(schedule, datetime.datetime(2025, 1, 2, 20, 0))
+    check_contract(payload)
+    assert payload['days_til_test'] == 15 and payload['weeks_til_test'] == 2
+    assert payload['reminders_tomorrow'] == '   1. Essay'
+
+def test_countdown_stays_an_integer_after_the_last_exam(tmp_path):
+    schedule = write_schedule(tmp_path, [{'name': 'Finals', 'date': '2025-01-18'}])
+    today = datetime.datetime(2025, 2, 3, 20, 0)
+    payload = build(schedule, today)
+    check_contract(payload)
+    # Counts down past the exam, as the hard-coded countdown did
+    assert payload['days_til_test'] == (datetime.datetime(2025, 1, 18) - today).days
+
+def test_no_exams(tmp_path):
+    payload = build(write_schedule(tmp_path, []), datetime.datetime(2025, 2, 3, 20, 0))
+    check_contract(payload)
+    assert payload['days_til_test'] == 0 and payload['weeks_til_test'] == 0
+
+def test_extra_sections_are_opt_in(tmp_path):
+    template = {
+        'buckets': {'tomorrow': {'days': [1, 1]}},
+        'sections': {'upcoming_tests': {'list': 'exams', 'item': '{name}: {days}', 'empty': 'none'}},
+    }
+    schedule = write_schedule(tmp_path, [{'name': 'Finals', 'date': '2025-01-18'}], payload=template)
+    payload = build(schedule, datetime.datetime(2025, 1, 2, 20, 0))
+    assert payload == {'upcoming_tests': 'Finals: 15'}
@@ -0,0 +1,48 @@
+import json
+import pytest
+import reminders
+from metrics_store import load_metrics
+
+def write_config(tmp_path, profiles):
+    config_path = tmp_path / 'profiles.json'
+    config_path.write_text(json.dumps({'profiles': profiles}), encoding='UTF-8')
+    return str(config_path)
+
+def test_profiles_get_the_defaults(tmp_path):
+    profiles = reminders.load_profiles(write_config(tmp_path, [{'name': 'class-7a', 'webhook_url': 'http://a'}]))
+    assert profiles == [{'name': 'class-7a', 'csv': 'reminders.csv', 'webhook_url': 'http://a', 'timetable': None}]
+
+@pytest.mark.parametrize('name', ['../7a', '7a/b', '', '.', 'class 7a', 7])
+def test_names_must_be_safe_in_a_file_name(tmp_path, name):
+    with pytest.raises(ValueError, match='may only use'):
+        reminders.load_profiles(write_config(tmp_path, [{'name': name}]))
+
+def test_names_must_be_unique(tmp_path):
+    with pytest.raises(ValueError, match='more than once'):
+        reminders.load_profiles(write_config(tmp_path, [{'name': '7a'}, {'name': '7b'}, {'name': '7a'}]))
+
+def test_a_failed_profile_is_recorded(tmp_path, monkeypatch):
+    csv_path = tmp_path / 'reminders.csv'
+    csv_path.write_text('Event name,Event date and time,Weekday\nEssay,01/07/2025 09:00:00,Tue\n', encoding='UTF-8')
+    schedule_path = tmp_path / 'schedule.json'
+    schedule_path.write_text(json.dumps({'timetable': {}, 'exams': []}), encoding='UTF-8')
+    config_path = write_config(tmp_path, [{'name': name, 'csv': str(csv_path), 'webhook_url': f"http://{name}"}
+                                          for name in ['ok', 'down']])
+    metrics_path = str(tmp_path / 'metrics.jsonl')
+    monkeypatch.setattr(reminders, 'METRICS_ENABLED', True)
+    monkeypatch.setattr(reminders, 'METRICS_FILE_PATH', metrics_path)
+    monkeypatch.setattr(reminders, 'LOCK_FILE_PATH', str(tmp_path / 'reminders.lock'))
+    monkeypatch.setattr(reminders, 'SCHEDULE_PATH', str(schedule_path))
+
+    def deliver(url, payload, outbox_path):
+        if url == 'http://down':
+            raise OSError('outbox not writable')
+        return {'webhook_ok': True}
+
+    monkeypatch.setattr(reminders, 'deliver', deliver)
+    reminders.check_profiles(config_path)
+    records = {record['profile']: record for record in load_metrics(metrics_path)}
+    assert records['ok']['status'] == 'ok'
+    assert records['down']['status'] == 'failed'
+    assert records['down']['abort_reason'] == 'outbox not writable'
+    assert 'parse_time' in records['down'] and 'timestamp' in records['down']
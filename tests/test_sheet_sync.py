@@ -0,0 +1,157 @@
+import csv
+import re
+from event_cache import is_cache_fresh, load_cache, timestamps_to_datetimes
+from events import read_csv_columns
+from sheet_sync import CSV_HEADER, load_sync_state, sync_sheet
+
+RANGE_NAME = "Sheet1!A4:E"
+
+# Stand-in for the Sheets client over a list of rows starting at row 4 of a grid with
+# `grid_rows` rows: values().get() reports the grid's extent and values().batchGet(...)
+# returns the rows, rejecting ranges outside the grid like the API does
+class FakeSheets:
+    def __init__(self, rows, grid_rows=None):
+        self.rows = rows
+        self.grid_rows = grid_rows or len(rows) + 3
+        self.requests = []
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range, fields=None):
+        column = re.fullmatch(r".+!([A-Z]+):[A-Z]+", range).group(1)
+        self._result = {"range": f"Sheet1!{column}1:{column}{self.grid_rows}"}
+        return self
+
+    def batchGet(self, spreadsheetId, ranges):
+        self.requests.append(ranges)
+        value_ranges = []
+        for range_name in ranges:
+            first, last = map(int, re.fullmatch(r".+![A-Z]+(\d+):[A-Z]+(\d+)", range_name).groups())
+            if last > self.grid_rows:
+                raise ValueError(f"Range {range_name} exceeds grid limits")
+            values = self.rows[first - 4:last - 3]
+            # Trailing blank rows are left out and a page with no values has no "values" key
+            while values and not values[-1]:
+                values = values[:-1]
+            value_ranges.append({"range": range_name, "values": values} if values else {"range": range_name})
+        self._result = {"spreadsheetId": spreadsheetId, "valueRanges": value_ranges}
+        return self
+
+    def execute(self):
+        return self._result
+
+def sheet_rows(count):
+    return [[f"Event {i}", "", "", f"1/{i % 28 + 1}/2025 08:00:00", "Mon"] for i in range(count)]
+
+def read_csv(file_path):
+    with open(file_path, newline="", encoding="UTF-8") as file:
+        return list(csv.reader(file))
+
+def sync(service, tmp_path, **kwargs):
+    return sync_sheet(service, "sheet-id", RANGE_NAME, str(tmp_path / "reminders.csv"),
+                      str(tmp_path / "sync_state.json"), page_rows=10, pages_per_request=2, **kwargs)
+
+def test_first_sync_writes_every_row(tmp_path):
+    service = FakeSheets(sheet_rows(25) + [["short row"]])
+    summary = sync(service, tmp_path)
+    assert summary["written"] and summary["rows"] == 25 and summary["rows_changed"] == 25
+    rows = read_csv(tmp_path / "reminders.csv")
+    assert rows[0] == CSV_HEADER
+    assert rows[1] == ["Event 0", "1/1/2025 08:00:00", "Mon"]
+    assert len(rows) == 26
+    assert not (tmp_path / "reminders.csv.tmp").exists()
+
+def test_unchanged_sheet_skips_the_write(tmp_path):
+    service = FakeSheets(sheet_rows(25))
+    sync(service, tmp_path)
+    before = (tmp_path / "reminders.csv").stat().st_mtime_ns
+    summary = sync(service, tmp_path)
+    assert not summary["written"] and summary["mode"] == "skip"
+    assert summary["rows_changed"] == 0 and summary["changes"] is None
+    assert (tmp_path / "reminders.csv").stat().st_mtime_ns == before
+
+def test_changed_sheet_reports_the_diff(tmp_path):
+    rows = sheet_rows(25)
+    sync(FakeSheets(rows), tmp_path)
+    rows = [list(row) for row in rows]
+    rows[3][3] = "2/20/2025 08:00:00"  # moved
+    rows[4][4] = "Tue"  # changed
+    del rows[5]  # removed
+    rows.append(["New event", "", "", "3/1/2025 08:00:00", "Sat"])  # added
+    summary = sync(FakeSheets(rows), tmp_path)
+    assert summary["written"] and summary["rows"] == 25
+    changes = summary["changes"]
+    assert changes["moved"] == [{"name": "Event 3", "from": "1/4/2025 08:00:00", "to": "2/20/2025 08:00:00", "weekday": "Mon"}]
+    assert changes["changed"] == [{"name": "Event 4", "date": "1/5/2025 08:00:00", "weekday": "Tue"}]
+    assert changes["removed"] == [{"name": "Event 5", "date": "1/6/2025 08:00:00", "weekday": "Mon"}]
+    assert changes["added"] == [{"name": "New event", "date": "3/1/2025 08:00:00", "weekday": "Sat"}]
+    assert summary["rows_changed"] == 4
+    assert read_csv(tmp_path / "reminders.csv")[-1] == ["New event", "3/1/2025 08:00:00", "Sat"]
+
+def test_full_rewrites_an_unchanged_sheet(tmp_path):
+    service = FakeSheets(sheet_rows(25))
+    sync(service, tmp_path)
+    (tmp_path / "reminders.csv").write_text("stale", encoding="UTF-8")
+    # The digest still matches, but --full writes the sheet anyway
+    summary = sync(service, tmp_path, full=True)
+    assert summary["written"] and summary["mode"] == "full"
+    assert summary["rows_changed"] == 0
+    assert len(read_csv(tmp_path / "reminders.csv")) == 26
+
+def test_empty_sheet_keeps_the_previous_csv(tmp_path):
+    sync(FakeSheets(sheet_rows(5)), tmp_path)
+    summary = sync(FakeSheets([]), tmp_path)
+    assert summary["rows"] == 0 and not summary["written"]
+    assert len(read_csv(tmp_path / "reminders.csv")) == 6
+    assert load_sync_state(str(tmp_path / "sync_state.json"))["row_count"] == 5
+
+def test_blank_block_inside_the_sheet_does_not_end_the_fetch(tmp_path):
+    rows = sheet_rows(5) + [[]] * 30 + sheet_rows(30)[5:]
+    service = FakeSheets(rows, grid_rows=len(rows) + 50)
+    summary = sync(service, tmp_path)
+    assert summary["rows"] == 30
+    assert read_csv(tmp_path / "reminders.csv")[-1][0] == "Event 29"
+    # Pages end at the last row of the grid
+    assert service.requests[-1][-1] == "Sheet1!A104:E110"
+
+def test_cache_is_built_from_the_streamed_rows(tmp_path):
+    csv_path = tmp_path / "reminders.csv"
+    cache_path = str(tmp_path / "reminders.cache")
+    service = FakeSheets(sheet_rows(25))
+    summary = sync(service, tmp_path, cache_path=cache_path)
+    assert summary["cache_written"] and is_cache_fresh(str(csv_path), cache_path)
+    cache = load_cache(cache_path)
+    columns = read_csv_columns(str(csv_path))
+    assert cache["name"] == columns["name"] and cache["weekday"] == columns["weekday"]
+    assert timestamps_to_datetimes(cache["timestamp"]) == columns["date"]
+
+    # Unchanged sheet: the cache is only rewritten when it no longer matches the CSV
+    assert not sync(service, tmp_path, cache_path=cache_path)["cache_written"]
+    (tmp_path / "reminders.cache").unlink()
+    summary = sync(service, tmp_path, cache_path=cache_path)
+    assert not summary["written"] and summary["cache_written"]
+    assert is_cache_fresh(str(csv_path), cache_path)
+
+def test_invalid_date_skips_the_cache_but_not_the_csv(tmp_path):
+    rows = sheet_rows(5) + [["Bad date", "", "", "someday", "Mon"]]
+    summary = sync(FakeSheets(rows), tmp_path, cache_path=str(tmp_path / "reminders.cache"))
+    assert summary["written"] and not summary["cache_written"]
+    assert not (tmp_path / "reminders.cache").exists()
+    assert len(read_csv(tmp_path / "reminders.csv")) == 7
+
+def test_state_only_keeps_the_digest(tmp_path):
+    rows = sheet_rows(25)
+    sync(FakeSheets(rows), tmp_path)
+    state = load_sync_state(str(tmp_path / "sync_state.json"))
+    assert set(state) == {"digest", "row_count"}
+
+    # Duplicate name and date: only the second occurrence is removed
+    summary = sync(FakeSheets(rows + [rows[0], rows[0]]), tmp_path)
+    assert summary["changes"]["added"] == [{"name": "Event 0", "date": "1/1/2025 08:00:00", "weekday": "Mon"}] * 2
+    summary = sync(FakeSheets(rows + [rows[0]]), tmp_path)
+    assert summary["changes"]["removed"] == [{"name": "Event 0", "date": "1/1/2025 08:00:00", "weekday": "Mon"}]
+    assert summary["rows_changed"] == 1
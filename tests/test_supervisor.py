@@ -0,0 +1,64 @@
+import json
+import subprocess
+import sys
+import time
+import pytest
+from supervisor import RunAborted, RunLock, RunLocked, Supervisor
+
+def test_lock_is_exclusive_until_released(tmp_path):
+    lock_path = str(tmp_path / 'run.lock')
+    first = RunLock(lock_path)
+    assert first.acquire()
+    assert not RunLock(lock_path).acquire()
+    first.release()
+    assert RunLock(lock_path).acquire()
+
+def test_lock_left_by_a_dead_process_is_free(tmp_path):
+    lock_path = tmp_path / 'run.lock'
+    # A killed owner leaves the file behind, here with a PID that is always alive
+    lock_path.write_text(json.dumps({'pid': 1, 'started': '2025-01-01T00:00:00'}))
+    assert RunLock(str(lock_path)).acquire()
+
+def test_lock_held_by_another_process(tmp_path):
+    lock_path = str(tmp_path / 'run.lock')
+    holder = subprocess.Popen(
+        [sys.executable, '-c', f"import sys, time; sys.path[:0] = {sys.path!r}; from supervisor import RunLock; "
+                               f"RunLock({lock_path!r}).acquire(); print('held', flush=True); time.sleep(30)"],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        assert holder.stdout.readline().strip() == 'held'
+        with pytest.raises(RunLocked):
+            with Supervisor(lock_path):
+                pass
+    finally:
+        holder.kill()
+        holder.wait()
+    # The kernel released the lock with the process
+    assert RunLock(lock_path).acquire()
+
+def test_deadline_raises_in_the_stage_when_not_exiting(tmp_path):
+    lock_path = str(tmp_path / 'run.lock')
+    records = []
+    start_time = time.perf_counter()
+    with pytest.raises(RunAborted) as aborted:
+        with Supervisor(lock_path, deadlines={'slow': 0.3}, memory_limit_mb=0, on_abort=records.append,
+                        poll_interval=0.05, exit_on_abort=False) as supervisor:
+            with supervisor.stage('fast'):
+                pass
+            with supervisor.stage('slow'):
+                # A blocking call is interrupted by the abort signal
+                time.sleep(10)
+    assert time.perf_counter() - start_time < 5
+    assert aborted.value.record['status'] == 'timed_out' and aborted.value.record['abort_stage'] == 'slow'
+    assert [record['status'] for record in records] == ['timed_out']
+    assert 'stage_fast_time' in records[0]
+    # The lock was released for the next run
+    assert RunLock(lock_path).acquire()
+
+def test_run_finishing_in_time_is_not_recorded(tmp_path):
+    records = []
+    with Supervisor(str(tmp_path / 'run.lock'), deadlines={'quick': 5}, memory_limit_mb=0,
+                    on_abort=records.append, poll_interval=0.05, exit_on_abort=False) as supervisor:
+        with supervisor.stage('quick'):
+            time.sleep(0.1)
+    assert records == []
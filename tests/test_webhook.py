@@ -0,0 +1,127 @@
+import datetime
+import http.server
+import json
+import threading
+import pytest
+import webhook
+
+# Local HTTP server standing in for the Make webhook: answers each POST with the next
+# status of `statuses` (200 once they run out) and keeps the payloads it received
+class StubWebhook:
+    def __init__(self, statuses=()):
+        stub = self
+        self.statuses = list(statuses)
+        self.received = []
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                stub.received.append(json.loads(self.rfile.read(int(self.headers['Content-Length']))))
+                self.send_response(stub.statuses.pop(0) if stub.statuses else 200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/webhook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stub():
+    stub = StubWebhook()
+    yield stub
+    stub.close()
+
+@pytest.fixture
+def outbox_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(webhook, 'BACKOFF', 0)
+    monkeypatch.setattr(webhook, 'RETRIES', 2)
+    return str(tmp_path / 'outbox.jsonl')
+
+def test_retries_a_503_then_delivers(stub, outbox_path):
+    stub.statuses = [503]
+    delivery = webhook.deliver(stub.url, {'day': 1}, outbox_path=outbox_path)
+    assert delivery['webhook_ok'] and delivery['webhook_status'] == 200
+    assert delivery['webhook_attempts'] == 2
+    assert stub.received == [{'day': 1}, {'day': 1}]
+    assert webhook.load_outbox(outbox_path) == []
+
+def test_client_errors_are_not_retried(stub, outbox_path):
+    stub.statuses = [400]
+    delivery = webhook.deliver(stub.url, {'day': 1}, outbox_path=outbox_path)
+    assert not delivery['webhook_ok'] and delivery['webhook_attempts'] == 1
+    assert delivery['outbox_pending'] == 1
+
+def test_failed_payload_is_queued_and_replayed(stub, outbox_path):
+    stub.statuses = [503, 503, 503]
+    delivery = webhook.deliver(stub.url, {'day': 1}, outbox_path=outbox_path)
+    assert not delivery['webhook_ok'] and delivery['webhook_status'] == 503
+    assert delivery['webhook_attempts'] == 3 and delivery['outbox_pending'] == 1
+    [entry] = webhook.load_outbox(outbox_path)
+    assert entry['payload'] == {'day': 1} and entry['url'] == stub.url and entry['attempts'] == 3
+
+    delivery = webhook.deliver(stub.url, {'day': 2}, outbox_path=outbox_path)
+    assert delivery['webhook_ok'] and delivery['outbox_replayed'] == 1 and delivery['outbox_pending'] == 0
+    # The queued payload goes out before the new one
+    assert stub.received[-2:] == [{'day': 1}, {'day': 2}]
+    assert webhook.load_outbox(outbox_path) == []
+
+def test_entries_past_the_max_age_are_dropped(stub, outbox_path):
+    queued_at = datetime.datetime.now() - webhook.OUTBOX_MAX_AGE - datetime.timedelta(minutes=1)
+    webhook.save_outbox([{'id': 'old', 'url': stub.url, 'payload': {'day': 0},
+                          'queued_at': queued_at.isoformat(), 'attempts': 4}], outbox_path)
+    delivery = webhook.deliver(stub.url, {'day': 1}, outbox_path=outbox_path)
+    assert delivery['webhook_ok'] and delivery['outbox_replayed'] == 0
+    assert stub.received == [{'day': 1}]
+    assert webhook.load_outbox(outbox_path) == []
+
+def test_unreachable_webhook_is_queued(outbox_path):
+    closed = StubWebhook()
+    closed.close()
+    delivery = webhook.deliver(closed.url, {'day': 1}, outbox_path=outbox_path)
+    assert not delivery['webhook_ok'] and delivery['webhook_status'] is None
+    assert delivery['webhook_attempts'] == 3 and delivery['outbox_pending'] == 1
+
+def test_payload_is_queued_before_it_is_sent(stub, outbox_path, monkeypatch):
+    # The outbox as a run killed during the POST would leave it
+    outbox_during_post = []
+    post_with_retry = webhook.post_with_retry
+
+    def post_and_look(url, payload):
+        outbox_during_post.append([entry['payload'] for entry in webhook.load_outbox(outbox_path)])
+        return post_with_retry(url, payload)
+
+    monkeypatch.setattr(webhook, 'post_with_retry', post_and_look)
+    delivery = webhook.deliver(stub.url, {'day': 1}, outbox_path=outbox_path)
+    assert outbox_during_post == [[{'day': 1}]]
+    assert delivery['webhook_ok'] and webhook.load_outbox(outbox_path) == []
+
+def queue_entry(outbox_path, url, day, age):
+    queued_at = datetime.datetime.now() - age
+    entry = {'id': f"day{day}", 'url': url, 'payload': {'day': day}, 'queued_at': queued_at.isoformat(), 'attempts': 4}
+    webhook.save_outbox(webhook.load_outbox(outbox_path) + [entry], outbox_path)
+
+def test_yesterdays_payload_is_dropped_however_early_the_run_starts(stub, outbox_path):
+    # On the daily schedule the previous payload is about 24 h old, give or take how long
+    # each run took to get to its delivery
+    queue_entry(outbox_path, stub.url, 0, datetime.timedelta(hours=24, minutes=5))
+    queue_entry(outbox_path, stub.url, 1, datetime.timedelta(hours=23, minutes=55))
+    delivery = webhook.deliver(stub.url, {'day': 2}, outbox_path=outbox_path)
+    assert delivery['outbox_replayed'] == 0 and stub.received == [{'day': 2}]
+
+def test_same_day_retry_replays_the_outbox(stub, outbox_path):
+    queue_entry(outbox_path, stub.url, 1, datetime.timedelta(hours=2))
+    queue_entry(outbox_path, stub.url, 2, datetime.timedelta(minutes=10))
+    stub.statuses = [200, 503, 503, 503]
+    assert webhook.replay_outbox(outbox_path) == {'outbox_replayed': 1, 'outbox_pending': 1}
+    [entry] = webhook.load_outbox(outbox_path)
+    assert entry['payload'] == {'day': 2} and entry['attempts'] == 7
+
+    assert webhook.replay_outbox(outbox_path) == {'outbox_replayed': 1, 'outbox_pending': 0}
+    assert stub.received == [{'day': 1}] + [{'day': 2}] * 4
+    assert webhook.load_outbox(outbox_path) == []
@@ -0,0 +1,71 @@
+import contextlib
+import os
+import time
+import tracemalloc
+
+# Per-stage timing for the scripts' metrics records. Wrap each stage of a run in
+# timer.span(name); timer.metrics() then gives stage_<name>_time fields (seconds) and,
+# with memory tracing on, stage_<name>_peak_kb fields (tracemalloc peak above the
+# memory in use when the stage started). Spans can nest: a stage's time excludes the
+# time of the spans inside it, so the stage times of a run add up to its total.
+# A span entered several times accumulates its time and keeps its highest peak.
+
+# Set TRACE_MEMORY=1 to record tracemalloc peaks (slows the run down noticeably)
+TRACE_MEMORY = os.getenv('TRACE_MEMORY', '0') == '1'
+
+# One Timer per run and per thread; tracemalloc itself is process-wide
+class Timer:
+    def __init__(self, trace_memory=None):
+        self.trace_memory = TRACE_MEMORY if trace_memory is None else trace_memory
+        self.durations = {}
+        self.peaks = {}
+        self._stack = []
+        self._started_tracing = False
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    @contextlib.contextmanager
+    def span(self, name):
+        frame = {'children': 0.0}
+        if self.trace_memory:
+            if self._stack:
+                # Resetting the peak below would lose the enclosing span's peak so far
+                parent = self._stack[-1]
+                parent['peak'] = max(parent['peak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+            frame['base'] = tracemalloc.get_traced_memory()[0]
+            frame['peak'] = 0
+        self._stack.append(frame)
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            self._stack.pop()
+            self.durations[name] = self.durations.get(name, 0.0) + elapsed - frame['children']
+            if self._stack:
+                self._stack[-1]['children'] += elapsed
+            if self.trace_memory:
+                peak = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+                self.peaks[name] = max(self.peaks.get(name, 0), peak - frame['base'])
+                if self._stack:
+                    self._stack[-1]['peak'] = max(self._stack[-1]['peak'], peak)
+
+    # Fields to merge into the run's metrics record
+    def metrics(self):
+        metrics = {f"stage_{name}_time": duration for name, duration in self.durations.items()}
+        for name, peak in self.peaks.items():
+            metrics[f"stage_{name}_peak_kb"] = peak / 1024
+        return metrics
+
+    # One-line breakdown for the log
+    def describe(self):
+        return ", ".join(f"{name} {duration:.4f} s" for name, duration in self.durations.items())
+
+    # Stop tracemalloc if this timer started it; later spans are only timed
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+            self.trace_memory = False
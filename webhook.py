@@ -0,0 +1,150 @@
+import datetime
+import json
+import logging
+import os
+import time
+import uuid
+
+# Webhook delivery with a pooled session, timeouts, exponential-backoff retries and a
+# durable outbox: payloads that still fail after retrying are stored in OUTBOX_PATH
+# and replayed before the next delivery, or sooner by replay_outbox() (the reminders
+# daemon calls it between scheduled runs).
+
+OUTBOX_PATH = 'webhook_outbox.jsonl'
+TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', '10'))
+RETRIES = int(os.getenv('WEBHOOK_RETRIES', '3'))
+BACKOFF = float(os.getenv('WEBHOOK_BACKOFF', '1'))
+# Queued payloads older than this are dropped instead of replayed (a stale reminder is noise).
+# Keep it well away from the interval between runs: at 24 h, the daily runs would find
+# yesterday's payload right at the limit and replay or drop it depending on start-up time.
+OUTBOX_MAX_AGE = datetime.timedelta(hours=float(os.getenv('WEBHOOK_OUTBOX_MAX_AGE_HOURS', '12')))
+
+_session = None
+
+# Shared session so every delivery in this process reuses pooled keep-alive connections.
+# requests is imported here rather than at module level to keep script start-up cheap.
+def get_session():
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+# POST a payload, retrying connection errors, timeouts, 429 and 5xx with exponential backoff.
+# Returns (ok, status_code, attempts, latency in seconds of the whole call).
+def post_with_retry(url, payload, timeout=None, retries=None, backoff=None):
+    import requests
+    timeout = TIMEOUT if timeout is None else timeout
+    retries = RETRIES if retries is None else retries
+    backoff = BACKOFF if backoff is None else backoff
+    start_time = time.perf_counter()
+    status_code = None
+    attempts = 0
+    for attempt in range(retries + 1):
+        attempts += 1
+        try:
+            response = get_session().post(url, json=payload, timeout=timeout)
+            status_code = response.status_code
+            if 200 <= status_code < 300:
+                return True, status_code, attempts, time.perf_counter() - start_time
+            logging.warning(f"Webhook returned {status_code} (attempt {attempts})")
+            if status_code < 500 and status_code != 429:
+                # Other client errors will not succeed on retry
+                break
+        except requests.RequestException as e:
+            logging.warning(f"Webhook request failed (attempt {attempts}): {e}")
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+    return False, status_code, attempts, time.perf_counter() - start_time
+
+# Load queued payloads from the outbox
+def load_outbox(outbox_path=OUTBOX_PATH):
+    if not os.path.exists(outbox_path):
+        return []
+    entries = []
+    with open(outbox_path, 'r', encoding='UTF-8') as file:
+        for line in file:
+            try:
+                entries.append(json.loads(line))
+            except json.JSONDecodeError:
+                logging.error(f"Skipping unreadable outbox entry in {outbox_path}")
+    return entries
+
+# Rewrite the outbox through a temp file so a crash never loses queued payloads
+def save_outbox(entries, outbox_path=OUTBOX_PATH):
+    if not entries:
+        if os.path.exists(outbox_path):
+            os.remove(outbox_path)
+        return
+    temp_path = f"{outbox_path}.tmp"
+    with open(temp_path, 'w', encoding='UTF-8') as file:
+        for entry in entries:
+            file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, outbox_path)
+
+# Replay queued entries as of `now`, dropping those past OUTBOX_MAX_AGE.
+# Returns the number replayed and the entries still pending.
+def replay_entries(entries, now):
+    pending = []
+    replayed = 0
+    for entry in entries:
+        if now - datetime.datetime.fromisoformat(entry['queued_at']) > OUTBOX_MAX_AGE:
+            logging.warning(f"Dropping outbox entry {entry['id']} queued at {entry['queued_at']}")
+            continue
+        ok, status_code, attempts, latency = post_with_retry(entry['url'], entry['payload'])
+        if ok:
+            logging.info(f"Replayed outbox entry {entry['id']} in {latency:.4f} seconds")
+            replayed += 1
+        else:
+            entry['attempts'] += attempts
+            pending.append(entry)
+    return replayed, pending
+
+# Replay the outbox on its own, without a new payload. Returns delivery stats like deliver()'s.
+def replay_outbox(outbox_path=OUTBOX_PATH):
+    queued = load_outbox(outbox_path)
+    replayed, pending = replay_entries(queued, datetime.datetime.now())
+    save_outbox(pending, outbox_path)
+    return {'outbox_replayed': replayed, 'outbox_pending': len(pending)}
+
+# Replay queued payloads, then deliver this one, queueing it if it still fails.
+# The payload is written to the outbox before anything is sent, so a run killed halfway
+# (e.g. by the supervisor) still has it replayed; a payload can then be sent twice, but
+# is never lost. Returns delivery stats to merge into the run's metrics.
+def deliver(url, payload, outbox_path=OUTBOX_PATH):
+    now = datetime.datetime.now()
+    entry = {
+        'id': uuid.uuid4().hex,
+        'url': url,
+        'payload': payload,
+        'queued_at': now.isoformat(),
+        'attempts': 0,
+    }
+    queued = load_outbox(outbox_path)
+    save_outbox(queued + [entry], outbox_path)
+
+    replayed, pending = replay_entries(queued, now)
+
+    ok, status_code, attempts, latency = post_with_retry(url, payload)
+    if ok:
+        logging.info(f"Successfully called webhook in {latency:.4f} seconds")
+    else:
+        logging.error(f"Failed to call webhook after {attempts} attempts: {status_code}, queued in {outbox_path}")
+        entry['attempts'] = attempts
+        pending.append(entry)
+    save_outbox(pending, outbox_path)
+
+    return {
+        'webhook_ok': ok,
+        'webhook_status': status_code,
+        'webhook_attempts': attempts,
+        'webhook_latency': latency,
+        'outbox_replayed': replayed,
+        'outbox_pending': len(pending),
+    }